@@ -0,0 +1,270 @@
+# app/artifacts.py
+"""
+Per-job result artifacts. Instead of one big pretty-printed JSON file, a job's result lives in
+data/results/<job_id>/ as separate files so readers only load what they need:
+
+    meta.json              status, title, steps, errors, document_url, qna_summary, ...
+    document.md            full markdown
+    ocr.json.gz            raw OCR payload (gzip)
+    annotations.json.gz    bbox annotations payload (gzip), when requested
+    qna.jsonl              append-only QnA log, one {"question", "answer", ...} per line
+    retrieval.json.gz      chunks + BM25 index of the markdown used by QnA (see app.retrieval)
+    document-<key>.docx    cached Word rendering of the result (see app.render)
+    pages/NNNNN.md         per-page markdown of sharded OCR
+
+Legacy data/results/<job_id>.json files are migrated on first access, or all at once with
+
+    python -m app.artifacts migrate [--keep-legacy]
+"""
+import os
+import sys
+import gzip
+import json
+import argparse
+import threading
+from datetime import datetime
+
+from .utils import RESULTS, result_path
+
+META = "meta.json"
+MARKDOWN = "document.md"
+OCR = "ocr.json.gz"
+ANNOTATIONS = "annotations.json.gz"
+QNA = "qna.jsonl"
+
+PARTS = ("meta", "markdown", "ocr", "annotations", "qna")
+
+_migrate_lock = threading.Lock()
+
+def artifact_dir(job_id):
+    return RESULTS / job_id
+
+def artifact_path(job_id, name):
+    return artifact_dir(job_id) / name
+
+def jsonable(obj):
+    """SDK responses are pydantic models: dump them as real JSON instead of their repr()."""
+    if hasattr(obj, "model_dump"):
+        try:
+            return obj.model_dump(mode="json")
+        except Exception:
+            pass
+    if hasattr(obj, "to_dict"):
+        try:
+            return obj.to_dict()
+        except Exception:
+            pass
+    return obj
+
+def _atomic_write(path, data: bytes):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _write_json(path, obj, compress=False, indent=None):
+    data = json.dumps(jsonable(obj), default=str, ensure_ascii=False, indent=indent).encode("utf-8")
+    if compress:
+        data = gzip.compress(data, compresslevel=6)
+    _atomic_write(path, data)
+
+def _read_json(path, compressed=False):
+    if not path.exists():
+        return None
+    opener = gzip.open if compressed else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_result(job_id, result: dict):
+    """
+    Split a pipeline result dict into artifacts. Returns the artifact directory.
+    """
+    d = artifact_dir(job_id)
+    d.mkdir(parents=True, exist_ok=True)
+    meta = {k: v for k, v in result.items() if k not in ("ocr", "full_markdown", "annotations", "qna_history")}
+    meta.setdefault("job_id", job_id)
+    meta.setdefault("status", "completed")
+    meta["has_markdown"] = bool(result.get("full_markdown"))
+    meta["written_at"] = datetime.utcnow().isoformat()
+    if result.get("full_markdown") is not None:
+        _atomic_write(d / MARKDOWN, str(result["full_markdown"]).encode("utf-8"))
+    if result.get("ocr") is not None:
+        _write_json(d / OCR, result["ocr"], compress=True)
+    if result.get("annotations") is not None:
+        _write_json(d / ANNOTATIONS, result["annotations"], compress=True)
+    for entry in result.get("qna_history") or []:
+        append_qna(job_id, entry)
+    # meta last: its presence marks a complete result
+    _write_json(d / META, meta, indent=2)
+    return str(d)
+
+def write_failure(job_id, error):
+    d = artifact_dir(job_id)
+    d.mkdir(parents=True, exist_ok=True)
+    _write_json(d / META, {"job_id": job_id, "status": "failed", "error": str(error), "written_at": datetime.utcnow().isoformat()}, indent=2)
+    return str(d)
+
+def result_exists(job_id):
+    return artifact_path(job_id, META).exists() or os.path.exists(result_path(job_id))
+
+def _ensure_migrated(job_id):
+    if artifact_path(job_id, META).exists():
+        return True
+    if os.path.exists(result_path(job_id)):
+        return migrate_legacy(job_id)
+    return False
+
+def read_meta(job_id):
+    if not _ensure_migrated(job_id):
+        return None
+    return _read_json(artifact_path(job_id, META)) or {}
+
+def update_meta(job_id, **fields):
+    meta = read_meta(job_id)
+    if meta is None:
+        return None
+    meta.update(fields)
+    _write_json(artifact_path(job_id, META), meta, indent=2)
+    return meta
+
+def markdown_path(job_id):
+    if not _ensure_migrated(job_id):
+        return None
+    p = artifact_path(job_id, MARKDOWN)
+    return str(p) if p.exists() else None
+
+def read_markdown(job_id):
+    p = markdown_path(job_id)
+    if not p:
+        return None
+    with open(p, "r", encoding="utf-8") as f:
+        return f.read()
+
+def read_ocr(job_id):
+    if not _ensure_migrated(job_id):
+        return None
+    return _read_json(artifact_path(job_id, OCR), compressed=True)
+
+def read_annotations(job_id):
+    if not _ensure_migrated(job_id):
+        return None
+    return _read_json(artifact_path(job_id, ANNOTATIONS), compressed=True)
+
+def append_qna(job_id, entry: dict):
+    """Append one QnA entry; the existing log is never rewritten."""
+    d = artifact_dir(job_id)
+    d.mkdir(parents=True, exist_ok=True)
+    entry = dict(entry)
+    entry.setdefault("at", datetime.utcnow().isoformat())
+    line = json.dumps(jsonable(entry), default=str, ensure_ascii=False) + "\n"
+    with open(d / QNA, "a", encoding="utf-8") as f:
+        f.write(line)
+
+def read_qna(job_id):
+    if not _ensure_migrated(job_id):
+        return []
+    p = artifact_path(job_id, QNA)
+    if not p.exists():
+        return []
+    entries = []
+    with open(p, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # torn last line after a crash
+                continue
+    return entries
+
+def load_result(job_id, parts=PARTS):
+    """
+    Reassemble the combined result view (the old single-file layout) from the requested parts.
+    """
+    meta = read_meta(job_id)
+    if meta is None:
+        return None
+    result = dict(meta)
+    if meta.get("status") == "failed":
+        return result
+    if "markdown" in parts:
+        md = read_markdown(job_id)
+        if md is not None:
+            result["full_markdown"] = md
+    if "ocr" in parts:
+        ocr = read_ocr(job_id)
+        if ocr is not None:
+            result["ocr"] = ocr
+    if "annotations" in parts:
+        ann = read_annotations(job_id)
+        if ann is not None:
+            result["annotations"] = ann
+    if "qna" in parts:
+        result["qna_history"] = read_qna(job_id)
+    return result
+
+def migrate_legacy(job_id, keep_legacy=False):
+    """
+    Convert data/results/<job_id>.json into artifacts. Returns True if the job now has artifacts.
+    """
+    legacy = result_path(job_id)
+    with _migrate_lock:
+        if artifact_path(job_id, META).exists():
+            return True
+        if not os.path.exists(legacy):
+            return False
+        try:
+            with open(legacy, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            # legacy writer fell back to str(result) when JSON failed; keep it as an error record
+            data = {"status": "failed", "error": "unreadable legacy result"}
+        if not isinstance(data, dict):
+            data = {"status": "failed", "error": "unreadable legacy result"}
+        if data.get("status") == "failed":
+            write_failure(job_id, data.get("error"))
+        else:
+            # old flat pages dir, if any, moves under the artifact dir
+            old_pages = RESULTS / f"{job_id}.pages"
+            write_result(job_id, data)
+            if old_pages.exists() and not artifact_path(job_id, "pages").exists():
+                os.replace(old_pages, artifact_path(job_id, "pages"))
+        if not keep_legacy:
+            os.remove(legacy)
+        return True
+
+def migrate_all(keep_legacy=False):
+    migrated = 0
+    for name in os.listdir(RESULTS):
+        if not name.endswith(".json"):
+            continue
+        job_id = name[:-5]
+        if artifact_path(job_id, META).exists():
+            continue
+        if migrate_legacy(job_id, keep_legacy=keep_legacy):
+            migrated += 1
+    return migrated
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Result artifact maintenance")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("migrate", help="convert data/results/*.json into per-job artifact directories")
+    m.add_argument("--keep-legacy", action="store_true", help="keep the original JSON files")
+    args = parser.parse_args(argv)
+    if args.cmd == "migrate":
+        from .utils import init_db, get_db_conn
+        init_db()
+        n = migrate_all(keep_legacy=args.keep_legacy)
+        # point jobs.resultpath at the artifact directories
+        conn = get_db_conn()
+        with conn:
+            rows = conn.execute("SELECT job_id FROM jobs WHERE resultpath LIKE '%.json'").fetchall()
+            conn.executemany("UPDATE jobs SET resultpath = ? WHERE job_id = ?",
+                             [(str(artifact_dir(r["job_id"])), r["job_id"]) for r in rows if artifact_path(r["job_id"], META).exists()])
+        conn.close()
+        print(f"migrated {n} result file(s)")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
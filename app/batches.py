@@ -0,0 +1,187 @@
+# app/batches.py
+"""
+Batch ingestion. A batch is one `batches` row plus ordinary jobs carrying its batch_id; children
+run through the same queue (in their own lane, see jobqueue._pick_lane). Aggregate progress is a
+single indexed GROUP BY over jobs(batch_id, status), and every finished child publishes a
+`progress` event on the batch id (plus a terminal `status` event), so callers never poll children.
+"""
+import os
+import json
+import uuid
+import hashlib
+import zipfile
+from datetime import datetime
+
+from .utils import get_db_conn, new_job_id, UPLOADS, UPLOAD_CHUNK_BYTES
+from .events import emit, emit_status
+
+# total request size of a batch upload (0 = unlimited) and children per batch
+MAX_BATCH_MB = int(os.environ.get("MAX_BATCH_MB", "2048"))
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", "10000"))
+
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed", "application/x-zip")
+
+def max_batch_bytes():
+    return MAX_BATCH_MB * 1024 * 1024 if MAX_BATCH_MB > 0 else None
+
+def new_batch_id():
+    return uuid.uuid4().hex
+
+def is_zip(upload_file):
+    return (upload_file.filename or "").lower().endswith(".zip") or (upload_file.content_type or "") in ZIP_CONTENT_TYPES
+
+def extract_zip(zip_path, max_member_bytes=None, max_files=BATCH_MAX_FILES, max_total_bytes=None):
+    """
+    Extract archive members one by one into UPLOADS, streaming each through the hasher, so memory
+    stays flat whatever the archive size. At most max_total_bytes are written for the whole archive;
+    members that don't fit are skipped. Returns (children, skipped); children are dicts with job_id,
+    filename, filepath, size_bytes, content_hash.
+    """
+    children, skipped = [], []
+    total = 0
+    with zipfile.ZipFile(zip_path) as zf:
+        for info in zf.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                continue
+            if len(children) >= max_files:
+                skipped.append({"filename": info.filename, "reason": "too many files"})
+                continue
+            if max_member_bytes and info.file_size > max_member_bytes:
+                skipped.append({"filename": info.filename, "reason": "too large"})
+                continue
+            if max_total_bytes is not None and total + info.file_size > max_total_bytes:
+                skipped.append({"filename": info.filename, "reason": "batch too large"})
+                continue
+            job_id = new_job_id()
+            # basename only: member paths never escape the uploads directory
+            dest = UPLOADS / f"{job_id}_{name}"
+            h = hashlib.sha256()
+            size = 0
+            with zf.open(info) as src, open(dest, "wb") as out:
+                while True:
+                    chunk = src.read(UPLOAD_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_member_bytes and size > max_member_bytes:
+                        break
+                    if max_total_bytes is not None and total + size > max_total_bytes:
+                        break
+                    h.update(chunk)
+                    out.write(chunk)
+            # declared sizes can lie (or zip bomb): the limits hold for the bytes actually written
+            if max_member_bytes and size > max_member_bytes:
+                os.remove(dest)
+                skipped.append({"filename": info.filename, "reason": "too large"})
+                continue
+            if max_total_bytes is not None and total + size > max_total_bytes:
+                os.remove(dest)
+                skipped.append({"filename": info.filename, "reason": "batch too large"})
+                continue
+            total += size
+            children.append({"job_id": job_id, "filename": name, "filepath": str(dest), "size_bytes": size, "content_hash": h.hexdigest()})
+    return children, skipped
+
+def create_batch(batch_id, name, children, options=None):
+    """
+    Insert the batch row and all child job rows in one transaction.
+    """
+    now = datetime.utcnow().isoformat()
+    conn = get_db_conn()
+    with conn:
+        conn.execute("INSERT INTO batches(batch_id, name, status, total, options, created_at) VALUES (?, ?, 'pending', ?, ?, ?)",
+                     (batch_id, name, len(children), json.dumps(options or {}), now))
+        conn.executemany("""
+        INSERT INTO jobs(job_id, title, filename, filepath, resultpath, status, created_at, pages, size_bytes, extra, content_hash, batch_id)
+        VALUES (?, NULL, ?, ?, NULL, 'pending', ?, NULL, ?, '{}', ?, ?)
+        """, [(c["job_id"], c["filename"], c.get("filepath"), now, c.get("size_bytes"), c.get("content_hash"), batch_id) for c in children])
+    conn.close()
+
+def get_batch(batch_id):
+    conn = get_db_conn()
+    try:
+        row = conn.execute("SELECT * FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+def _aggregate(conn, batch_id):
+    rows = conn.execute("""
+    SELECT status, COUNT(*) AS n, COALESCE(SUM(pages), 0) AS pages, MAX(completed_at) AS last_completed
+    FROM jobs WHERE batch_id = ? GROUP BY status
+    """, (batch_id,)).fetchall()
+    counts = {r["status"]: r["n"] for r in rows}
+    pages = sum(r["pages"] for r in rows if r["status"] == "completed")
+    last = max((r["last_completed"] for r in rows if r["last_completed"]), default=None)
+    return counts, pages, last
+
+def batch_summary(batch_id):
+    """
+    Batch row plus aggregate progress: counts per status, progress ratio, documents and pages per
+    second since the batch was created. None for an unknown batch.
+    """
+    conn = get_db_conn()
+    try:
+        row = conn.execute("SELECT * FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+        if not row:
+            return None
+        counts, pages, last = _aggregate(conn, batch_id)
+    finally:
+        conn.close()
+    batch = dict(row)
+    batch["options"] = json.loads(batch.get("options") or "{}")
+    total = batch["total"] or 0
+    done = counts.get("completed", 0) + counts.get("failed", 0)
+    end = datetime.fromisoformat(batch["completed_at"]) if batch.get("completed_at") else datetime.utcnow()
+    elapsed = max((end - datetime.fromisoformat(batch["created_at"])).total_seconds(), 1e-6)
+    batch.update({
+        "counts": counts,
+        "finished": done,
+        "progress": round(done / total, 4) if total else 1.0,
+        "pages": pages,
+        "elapsed_seconds": round(elapsed, 3),
+        "docs_per_second": round(counts.get("completed", 0) / elapsed, 4),
+        "pages_per_second": round(pages / elapsed, 4),
+        "last_completed_at": last,
+    })
+    return batch
+
+def child_finished(job_id):
+    """
+    Called when a job reaches a terminal status: publishes the batch's progress and closes the
+    batch when it was the last child. No-op for jobs outside a batch; never raises.
+    """
+    try:
+        conn = get_db_conn()
+        try:
+            row = conn.execute("SELECT batch_id FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            batch_id = row["batch_id"] if row else None
+            if not batch_id:
+                return
+            total = conn.execute("SELECT total FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()["total"]
+            counts, pages, _ = _aggregate(conn, batch_id)
+            done = counts.get("completed", 0) + counts.get("failed", 0)
+            closed = False
+            with conn:
+                if done >= total:
+                    # conditional update: only one of several concurrently finishing children closes the batch
+                    closed = conn.execute("UPDATE batches SET status = 'completed', completed_at = ? WHERE batch_id = ? AND status != 'completed'",
+                                          (datetime.utcnow().isoformat(), batch_id)).rowcount == 1
+                else:
+                    conn.execute("UPDATE batches SET status = 'processing' WHERE batch_id = ? AND status = 'pending'", (batch_id,))
+        finally:
+            conn.close()
+        progress = {"finished": done, "total": total, "completed": counts.get("completed", 0), "failed": counts.get("failed", 0), "pages": pages}
+        emit(batch_id, "progress", progress)
+        if closed:
+            emit_status(batch_id, "completed", **progress)
+    except Exception:
+        pass
+
+def list_batches(limit=50):
+    conn = get_db_conn()
+    try:
+        return [dict(r) for r in conn.execute("SELECT * FROM batches ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()]
+    finally:
+        conn.close()
@@ -0,0 +1,245 @@
+# app/cache.py
+import os
+import re
+import gzip
+import json
+import hashlib
+import unicodedata
+from datetime import datetime, timedelta
+
+from .utils import BASE, get_db_conn
+from .artifacts import jsonable
+from .retrieval import clamp_top_k
+
+CACHE_DIR = BASE / "cache"
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "1") not in ("0", "false", "False")
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "1000"))
+RESULT_CACHE_MAX_MB = int(os.environ.get("RESULT_CACHE_MAX_MB", "512"))
+RESULT_CACHE_MAX_AGE_DAYS = int(os.environ.get("RESULT_CACHE_MAX_AGE_DAYS", "30"))
+
+QNA_CACHE_ENABLED = os.environ.get("QNA_CACHE_ENABLED", "1") not in ("0", "false", "False")
+QNA_CACHE_TTL_HOURS = float(os.environ.get("QNA_CACHE_TTL_HOURS", "168"))
+QNA_CACHE_MAX_ENTRIES = int(os.environ.get("QNA_CACHE_MAX_ENTRIES", "10000"))
+
+# fields of a result that do not depend on the job itself and can be replayed for a new job
+# (not document_url: a signed URL expires and belongs to the other job's upload)
+CACHEABLE_FIELDS = ("ocr", "full_markdown", "title", "annotations", "qna_summary", "steps")
+
+def result_cache_key(content_hash, do_annotations=False, annotation_schema=None, do_qna=False):
+    """
+    Key a cached result by document content and the processing options that change the output.
+    """
+    if not content_hash:
+        return None
+    # the schema only matters when annotations actually run
+    schema = annotation_schema if (do_annotations and annotation_schema) else None
+    opts = {
+        "do_annotations": bool(do_annotations and annotation_schema),
+        "annotation_schema": schema,
+        "do_qna": bool(do_qna),
+    }
+    raw = content_hash + "|" + json.dumps(opts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _cache_file(cache_key):
+    return str(CACHE_DIR / f"{cache_key}.json.gz")
+
+def bump_stat(cache, hit):
+    conn = get_db_conn()
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO cache_stats(cache, hits, misses) VALUES (?, 0, 0)", (cache,))
+        col = "hits" if hit else "misses"
+        conn.execute(f"UPDATE cache_stats SET {col} = {col} + 1 WHERE cache = ?", (cache,))
+    conn.close()
+
+def _delete_entry(conn, cache_key, cachepath):
+    conn.execute("DELETE FROM result_cache WHERE cache_key = ?", (cache_key,))
+    try:
+        if cachepath and os.path.exists(cachepath):
+            os.remove(cachepath)
+    except OSError:
+        pass
+
+def lookup_result(cache_key, record=True):
+    """
+    Return the cached result dict for cache_key or None. Expired or broken entries count as a miss.
+    """
+    if not RESULT_CACHE_ENABLED or not cache_key:
+        return None
+    conn = get_db_conn()
+    try:
+        cur = conn.execute("SELECT * FROM result_cache WHERE cache_key = ?", (cache_key,))
+        row = cur.fetchone()
+        cached = None
+        if row:
+            created = datetime.fromisoformat(row["created_at"])
+            expired = datetime.utcnow() - created > timedelta(days=RESULT_CACHE_MAX_AGE_DAYS)
+            if not expired and row["cachepath"] and os.path.exists(row["cachepath"]):
+                try:
+                    opener = gzip.open if row["cachepath"].endswith(".gz") else open
+                    with opener(row["cachepath"], "rt", encoding="utf-8") as f:
+                        cached = json.load(f)
+                    cached["pages"] = row["pages"]
+                except Exception:
+                    cached = None
+            with conn:
+                if cached is None:
+                    _delete_entry(conn, cache_key, row["cachepath"])
+                else:
+                    conn.execute("UPDATE result_cache SET last_used_at = ?, hits = hits + 1 WHERE cache_key = ?", (datetime.utcnow().isoformat(), cache_key))
+    finally:
+        conn.close()
+    if record:
+        bump_stat("result", cached is not None)
+    return cached
+
+def store_result(cache_key, content_hash, result, pages=None):
+    """
+    Store the job-independent part of a completed result and run eviction.
+    """
+    if not RESULT_CACHE_ENABLED or not cache_key:
+        return
+    entry = {k: jsonable(result[k]) for k in CACHEABLE_FIELDS if k in result}
+    path = _cache_file(cache_key)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(entry, f, default=str, ensure_ascii=False)
+    now = datetime.utcnow().isoformat()
+    conn = get_db_conn()
+    with conn:
+        conn.execute("""
+        INSERT OR REPLACE INTO result_cache(cache_key, content_hash, cachepath, pages, title, size_bytes, created_at, last_used_at, hits)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)
+        """, (cache_key, content_hash, path, pages, entry.get("title"), os.path.getsize(path), now, now))
+    conn.close()
+    evict_results()
+
+def evict_results():
+    """
+    Drop entries older than RESULT_CACHE_MAX_AGE_DAYS, then least recently used entries
+    until the cache fits RESULT_CACHE_MAX_ENTRIES and RESULT_CACHE_MAX_MB.
+    """
+    cutoff = (datetime.utcnow() - timedelta(days=RESULT_CACHE_MAX_AGE_DAYS)).isoformat()
+    max_bytes = RESULT_CACHE_MAX_MB * 1024 * 1024
+    removed = 0
+    conn = get_db_conn()
+    try:
+        with conn:
+            for row in conn.execute("SELECT cache_key, cachepath FROM result_cache WHERE created_at < ?", (cutoff,)).fetchall():
+                _delete_entry(conn, row["cache_key"], row["cachepath"])
+                removed += 1
+            totals = conn.execute("SELECT COUNT(*) AS n, COALESCE(SUM(size_bytes), 0) AS b FROM result_cache").fetchone()
+            count, total = totals["n"], totals["b"]
+            if count > RESULT_CACHE_MAX_ENTRIES or total > max_bytes:
+                for row in conn.execute("SELECT cache_key, cachepath, size_bytes FROM result_cache ORDER BY last_used_at ASC").fetchall():
+                    if count <= RESULT_CACHE_MAX_ENTRIES and total <= max_bytes:
+                        break
+                    _delete_entry(conn, row["cache_key"], row["cachepath"])
+                    count -= 1
+                    total -= row["size_bytes"] or 0
+                    removed += 1
+    finally:
+        conn.close()
+    return removed
+
+# ---------- QnA answer cache ----------
+def normalize_question(question):
+    """
+    Case, whitespace, unicode form and trailing punctuation don't change the answer.
+    """
+    q = unicodedata.normalize("NFKC", question or "").casefold()
+    q = re.sub(r"\s+", " ", q).strip()
+    return q.rstrip(" ?!.")
+
+def qna_cache_key(content_hash, model, question, mode=None, top_k=None):
+    """
+    Key a cached answer by document content, model and normalized question. mode is part of the
+    key because chunk-context and whole-document answers can differ, and so is top_k in chunk
+    mode (how many chunks the answer was built from).
+    """
+    if not content_hash or not question:
+        return None
+    parts = [content_hash, model or "", mode or "", normalize_question(question)]
+    if mode == "chunks":
+        # the chunk count actually used, so requests clamped to the same value share an entry
+        parts.append(f"top_k={clamp_top_k(top_k)}")
+    raw = "|".join(parts)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def lookup_answer(cache_key, record=True):
+    """
+    Cached {"answer", ...} for cache_key or None. Entries older than QNA_CACHE_TTL_HOURS are a miss.
+    """
+    if not QNA_CACHE_ENABLED or not cache_key:
+        return None
+    conn = get_db_conn()
+    try:
+        row = conn.execute("SELECT answer, extra, created_at FROM qna_cache WHERE cache_key = ?", (cache_key,)).fetchone()
+        cached = None
+        if row:
+            expired = datetime.utcnow() - datetime.fromisoformat(row["created_at"]) > timedelta(hours=QNA_CACHE_TTL_HOURS)
+            with conn:
+                if expired:
+                    conn.execute("DELETE FROM qna_cache WHERE cache_key = ?", (cache_key,))
+                else:
+                    conn.execute("UPDATE qna_cache SET last_used_at = ?, hits = hits + 1 WHERE cache_key = ?", (datetime.utcnow().isoformat(), cache_key))
+                    cached = json.loads(row["extra"] or "{}")
+                    cached["answer"] = row["answer"]
+    finally:
+        conn.close()
+    if record:
+        bump_stat("qna", cached is not None)
+    return cached
+
+def store_answer(cache_key, content_hash, model, question, answer, **extra):
+    if not QNA_CACHE_ENABLED or not cache_key:
+        return
+    now = datetime.utcnow().isoformat()
+    conn = get_db_conn()
+    with conn:
+        conn.execute("""
+        INSERT OR REPLACE INTO qna_cache(cache_key, content_hash, model, question, answer, extra, created_at, last_used_at, hits)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)
+        """, (cache_key, content_hash, model, normalize_question(question), answer, json.dumps(jsonable(extra), default=str), now, now))
+    conn.close()
+    evict_answers()
+
+def evict_answers():
+    """
+    Drop answers older than QNA_CACHE_TTL_HOURS, then least recently used ones beyond QNA_CACHE_MAX_ENTRIES.
+    """
+    cutoff = (datetime.utcnow() - timedelta(hours=QNA_CACHE_TTL_HOURS)).isoformat()
+    conn = get_db_conn()
+    try:
+        with conn:
+            removed = conn.execute("DELETE FROM qna_cache WHERE created_at < ?", (cutoff,)).rowcount
+            count = conn.execute("SELECT COUNT(*) AS n FROM qna_cache").fetchone()["n"]
+            if count > QNA_CACHE_MAX_ENTRIES:
+                removed += conn.execute("""
+                DELETE FROM qna_cache WHERE cache_key IN (
+                    SELECT cache_key FROM qna_cache ORDER BY last_used_at ASC LIMIT ?
+                )""", (count - QNA_CACHE_MAX_ENTRIES,)).rowcount
+    finally:
+        conn.close()
+    return removed
+
+def cache_stats():
+    conn = get_db_conn()
+    try:
+        stats = {}
+        for row in conn.execute("SELECT * FROM cache_stats").fetchall():
+            total = row["hits"] + row["misses"]
+            stats[row["cache"]] = {
+                "hits": row["hits"],
+                "misses": row["misses"],
+                "hit_rate": round(row["hits"] / total, 4) if total else 0.0,
+            }
+        totals = conn.execute("SELECT COUNT(*) AS n, COALESCE(SUM(size_bytes), 0) AS b FROM result_cache").fetchone()
+        stats.setdefault("result", {"hits": 0, "misses": 0, "hit_rate": 0.0})
+        stats["result"].update({"entries": totals["n"], "size_bytes": totals["b"]})
+        stats.setdefault("qna", {"hits": 0, "misses": 0, "hit_rate": 0.0})
+        stats["qna"]["entries"] = conn.execute("SELECT COUNT(*) AS n FROM qna_cache").fetchone()["n"]
+        return stats
+    finally:
+        conn.close()
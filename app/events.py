@@ -0,0 +1,102 @@
+# app/events.py
+"""
+Job progress events (status transitions, pipeline steps, page progress).
+
+Events are appended to the job_events table so that workers in other processes can publish
+them too; the SSE endpoint tails the table by id. Subscribers of the same job (or batch) in the
+same process are woken immediately on emit, others are picked up by a short poll of an indexed
+query.
+"""
+import os
+import json
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+from .utils import get_db_conn
+
+EVENTS_POLL_INTERVAL = float(os.environ.get("EVENTS_POLL_INTERVAL", "1.0"))
+EVENTS_RETENTION_DAYS = int(os.environ.get("EVENTS_RETENTION_DAYS", "7"))
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+# job_id (or batch_id) -> {(loop, event)} of the streams tailing it
+_listeners = {}
+_listeners_lock = threading.Lock()
+
+def emit(job_id, event, data=None):
+    """
+    Record an event for job_id and wake local subscribers. Never raises: progress reporting
+    must not break processing.
+    """
+    try:
+        conn = get_db_conn()
+        with conn:
+            conn.execute("INSERT INTO job_events(job_id, event, data, created_at) VALUES (?, ?, ?, ?)",
+                         (job_id, event, json.dumps(data or {}, default=str), datetime.utcnow().isoformat()))
+        conn.close()
+    except Exception:
+        return
+    with _listeners_lock:
+        listeners = list(_listeners.get(job_id, ()))
+    for loop, ev in listeners:
+        try:
+            loop.call_soon_threadsafe(ev.set)
+        except RuntimeError:
+            # loop already closed
+            pass
+
+def emit_status(job_id, status, **extra):
+    emit(job_id, "status", {"status": status, **extra})
+
+def fetch_events(job_id, after_id=0, limit=200):
+    conn = get_db_conn()
+    try:
+        rows = conn.execute("SELECT id, event, data FROM job_events WHERE job_id = ? AND id > ? ORDER BY id LIMIT ?", (job_id, after_id, limit)).fetchall()
+        return [{"id": r["id"], "event": r["event"], "data": json.loads(r["data"] or "{}")} for r in rows]
+    finally:
+        conn.close()
+
+def last_event_id(job_id):
+    conn = get_db_conn()
+    try:
+        row = conn.execute("SELECT MAX(id) AS m FROM job_events WHERE job_id = ?", (job_id,)).fetchone()
+        return row["m"] or 0
+    finally:
+        conn.close()
+
+def prune_events(days=EVENTS_RETENTION_DAYS):
+    cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    conn = get_db_conn()
+    with conn:
+        cur = conn.execute("DELETE FROM job_events WHERE created_at < ?", (cutoff,))
+        n = cur.rowcount
+    conn.close()
+    return n
+
+class Subscription:
+    """Wakes an async consumer when an event for job_id (or a batch id) is emitted in this process."""
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._ev = asyncio.Event()
+        self._key = (asyncio.get_running_loop(), self._ev)
+
+    def __enter__(self):
+        with _listeners_lock:
+            _listeners.setdefault(self.job_id, set()).add(self._key)
+        return self
+
+    def __exit__(self, *exc):
+        with _listeners_lock:
+            keys = _listeners.get(self.job_id)
+            if keys is not None:
+                keys.discard(self._key)
+                if not keys:
+                    del _listeners[self.job_id]
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._ev.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._ev.clear()
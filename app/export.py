@@ -0,0 +1,174 @@
+# app/export.py
+"""
+Bulk export of results as one ZIP, streamed while it is being built. Documents are selected by
+job ids, a created_at range or a full-text query. DOCX rendering runs in the shared process pool
+(app.procpool) with a bounded look-ahead window (rendered files are cached, see app.render), and
+every finished ZIP entry is handed to the response immediately, so memory stays flat however many
+documents are exported.
+"""
+import os
+import re
+import time
+import asyncio
+import zipfile
+
+from .utils import get_job, list_jobs_page
+from .artifacts import read_meta, markdown_path
+from .render import cached_docx, document_markdown
+from .procpool import run_async, PROCESS_POOL_WORKERS
+
+EXPORT_MAX_DOCS = int(os.environ.get("EXPORT_MAX_DOCS", "50000"))
+EXPORT_COPY_BYTES = 256 * 1024
+
+def select_jobs(job_ids=None, created_from=None, created_to=None, query=None, limit=None):
+    """
+    Yield completed job rows to export, without materialising the whole selection.
+    """
+    from .search import search
+    limit = min(limit or EXPORT_MAX_DOCS, EXPORT_MAX_DOCS)
+    if job_ids:
+        for job_id in job_ids[:limit]:
+            job = get_job(job_id)
+            if job and job.get("status") == "completed":
+                yield job
+        return
+    if query:
+        for hit in search(query, limit=limit):
+            job = get_job(hit["job_id"])
+            if job and job.get("status") == "completed":
+                yield job
+        return
+    # date range: walk the keyset-paginated listing page by page
+    cursor, sent = None, 0
+    while sent < limit:
+        rows, cursor = list_jobs_page(min(500, limit - sent), cursor, "completed", created_from, created_to)
+        for row in rows:
+            yield row
+        sent += len(rows)
+        if not cursor:
+            return
+
+class _Sink:
+    """Write-only file object collecting ZIP output until the response takes it (block by block)."""
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+_UNSAFE = re.compile(r"[^\w.\- ]+", re.UNICODE)
+
+def entry_name(job, ext, used):
+    base = _UNSAFE.sub("_", (job.get("title") or os.path.splitext(job.get("filename") or "")[0] or "document")).strip(" ._")[:80] or "document"
+    name = f"{base}-{job['job_id'][:8]}.{ext}"
+    n = 1
+    while name in used:
+        n += 1
+        name = f"{base}-{job['job_id'][:8]}-{n}.{ext}"
+    used.add(name)
+    return name
+
+def _pump(src, dst):
+    """Copy one block from src into the archive entry dst; False at the end of src."""
+    block = src.read(EXPORT_COPY_BYTES)
+    if not block:
+        return False
+    dst.write(block)
+    return True
+
+def _entry_info(name, stored=False):
+    info = zipfile.ZipInfo(name, date_time=_now())
+    # docx files are zip archives already
+    info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+    return info
+
+async def _stream_entry(zf, sink, info, path=None, data=None):
+    """
+    Write one entry (the file at path, else data) block by block, yielding the archive bytes
+    produced after every block, so no entry is ever held in memory whole. Entries are ZIP64: the
+    response is already streaming when an entry turns out to be larger than 2 GiB.
+    """
+    dst = await asyncio.to_thread(zf.open, info, "w", force_zip64=True)
+    try:
+        if path:
+            src = await asyncio.to_thread(open, path, "rb")
+            try:
+                while await asyncio.to_thread(_pump, src, dst):
+                    chunk = sink.take()
+                    if chunk:
+                        yield chunk
+            finally:
+                src.close()
+        else:
+            await asyncio.to_thread(dst.write, data)
+    finally:
+        await asyncio.to_thread(dst.close)
+    chunk = sink.take()
+    if chunk:
+        yield chunk
+
+def _markdown_source(job_id):
+    # (path, None) for the stored document.md, else (None, fallback bytes)
+    path = markdown_path(job_id)
+    if path:
+        return path, None
+    return None, document_markdown(read_meta(job_id) or {}, None).encode("utf-8")
+
+def _now():
+    return time.localtime()[:6]
+
+async def stream_zip(jobs, fmt="md"):
+    """
+    Async generator of ZIP bytes for the given job rows (iterable, consumed lazily in a thread).
+    """
+    sink = _Sink()
+    zf = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED)
+    used = set()
+    it = iter(jobs)
+    window = max(1, PROCESS_POOL_WORKERS) * 2
+
+    def next_job():
+        return next(it, None)
+
+    pending = []
+    exhausted = False
+
+    async def fill():
+        nonlocal exhausted
+        while not exhausted and len(pending) < (window if fmt == "docx" else 1):
+            job = await asyncio.to_thread(next_job)
+            if job is None:
+                exhausted = True
+                return
+            fut = asyncio.ensure_future(run_async(cached_docx, job["job_id"])) if fmt == "docx" else None
+            pending.append((job, fut))
+
+    try:
+        await fill()
+        while pending:
+            job, fut = pending.pop(0)
+            if fmt == "docx":
+                path = await fut
+                if path is not None:
+                    async for chunk in _stream_entry(zf, sink, _entry_info(entry_name(job, "docx", used), stored=True), path):
+                        yield chunk
+            else:
+                path, data = await asyncio.to_thread(_markdown_source, job["job_id"])
+                async for chunk in _stream_entry(zf, sink, _entry_info(entry_name(job, "md", used)), path, data):
+                    yield chunk
+            await fill()
+        await asyncio.to_thread(zf.close)
+        yield sink.take()
+    finally:
+        for _, fut in pending:
+            if fut is not None:
+                fut.cancel()
@@ -0,0 +1,291 @@
+# app/gateway.py
+"""
+Single gateway for every Mistral API call. Per endpoint ("files", "ocr", "chat") it applies
+
+- a token bucket (MISTRAL_RATE_<ENDPOINT> requests/second, 0 = unlimited),
+- an adaptive concurrency limit (AIMD: +1 slot per window of successful calls, halved on 429/503),
+- retries of 429, 5xx and transport errors with jittered exponential backoff that honours Retry-After.
+
+Sync callers (worker threads) use call(), coroutines use acall(); both share the same limits:
+
+    resp = call("ocr", client.ocr.process, model=..., document=...)
+    resp = await acall("chat", aclient.chat.complete_async, model=..., messages=...)
+
+Arguments are passed again on every attempt, so callables must be safe to repeat (e.g. open the
+file inside the callable rather than passing an already consumed file handle).
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from .metrics import MISTRAL_SECONDS, MISTRAL_WAIT_SECONDS
+
+ENDPOINTS = ("files", "ocr", "chat")
+
+MISTRAL_MAX_RETRIES = int(os.environ.get("MISTRAL_MAX_RETRIES", "5"))
+MISTRAL_BACKOFF_BASE = float(os.environ.get("MISTRAL_BACKOFF_BASE", "0.5"))
+MISTRAL_BACKOFF_MAX = float(os.environ.get("MISTRAL_BACKOFF_MAX", "30"))
+MISTRAL_CONCURRENCY_START = int(os.environ.get("MISTRAL_CONCURRENCY_START", "8"))
+MISTRAL_CONCURRENCY_MIN = int(os.environ.get("MISTRAL_CONCURRENCY_MIN", "1"))
+MISTRAL_CONCURRENCY_MAX = int(os.environ.get("MISTRAL_CONCURRENCY_MAX", "64"))
+
+RETRY_STATUSES = frozenset((408, 429, 500, 502, 503, 504))
+# statuses that mean "slow down" rather than "something broke"
+THROTTLE_STATUSES = frozenset((429, 503))
+
+def _status_of(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        resp = getattr(exc, "raw_response", None) or getattr(exc, "response", None)
+        status = getattr(resp, "status_code", None)
+    return status
+
+def retry_after(exc):
+    """Seconds from the Retry-After header of a failed call, None if absent or unparsable."""
+    headers = getattr(exc, "headers", None)
+    if headers is None:
+        resp = getattr(exc, "raw_response", None) or getattr(exc, "response", None)
+        headers = getattr(resp, "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(exc):
+    if isinstance(exc, (httpx.TransportError, httpx.TimeoutException)):
+        return True
+    return _status_of(exc) in RETRY_STATUSES
+
+def backoff_delay(attempt, exc=None):
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(MISTRAL_BACKOFF_MAX, MISTRAL_BACKOFF_BASE * (2 ** attempt)))
+    hint = retry_after(exc) if exc is not None else None
+    if hint is not None:
+        delay = max(delay, min(hint, MISTRAL_BACKOFF_MAX * 4))
+    return delay
+
+class TokenBucket:
+    """Thread-safe token bucket; reserve() returns how long the caller must wait for its token."""
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, self.rate))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        if self.rate <= 0:
+            with self.lock:
+                return max(0.0, self.paused_until - time.monotonic())
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            return max(wait, self.paused_until - now)
+
+    def pause(self, seconds):
+        """Hold back every caller of this endpoint, e.g. for a server-sent Retry-After."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+class AdaptiveLimit:
+    """
+    Concurrency limit shared by threads and event loops. The limit grows by one slot per window of
+    successes and is halved on throttling (at most once per window, so one burst of 429s counts once).
+    """
+    def __init__(self, start, minimum, maximum):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(start, self.minimum), self.maximum))
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.lock = threading.Lock()
+        self.waiters = deque()
+
+    def _grant(self):
+        # called with the lock held: hand free slots to waiters in FIFO order
+        while self.waiters and self.in_flight < int(self.limit):
+            waiter = self.waiters.popleft()
+            self.in_flight += 1
+            if isinstance(waiter, threading.Event):
+                waiter.set()
+            else:
+                loop, fut = waiter
+                loop.call_soon_threadsafe(lambda f=fut: f.done() or f.set_result(True))
+
+    def acquire(self):
+        with self.lock:
+            if not self.waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            ev = threading.Event()
+            self.waiters.append(ev)
+        ev.wait()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if not self.waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            fut = loop.create_future()
+            waiter = (loop, fut)
+            self.waiters.append(waiter)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            with self.lock:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                    raise
+            # the slot was granted while we were being cancelled
+            self.release()
+            raise
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+            self._grant()
+
+    def on_success(self):
+        with self.lock:
+            # only grow while the limit is what holds callers back
+            if self.waiters or self.in_flight + 1 >= int(self.limit):
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+                self._grant()
+
+    def on_throttle(self, window=1.0):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_decrease >= window:
+                self.limit = max(self.minimum, self.limit / 2)
+                self.last_decrease = now
+
+class Endpoint:
+    def __init__(self, name):
+        self.name = name
+        env = name.upper()
+        rate = float(os.environ.get(f"MISTRAL_RATE_{env}", "0"))
+        self.bucket = TokenBucket(rate, float(os.environ.get(f"MISTRAL_BURST_{env}", "0")) or None)
+        self.concurrency = AdaptiveLimit(MISTRAL_CONCURRENCY_START, MISTRAL_CONCURRENCY_MIN, MISTRAL_CONCURRENCY_MAX)
+        self.lock = threading.Lock()
+        self.counters = {"calls": 0, "succeeded": 0, "failed": 0, "retries": 0, "throttled": 0}
+
+    def count(self, key):
+        with self.lock:
+            self.counters[key] += 1
+
+    def _failed(self, exc):
+        status = _status_of(exc)
+        if status in THROTTLE_STATUSES:
+            self.count("throttled")
+            self.concurrency.on_throttle()
+            hint = retry_after(exc)
+            if hint:
+                self.bucket.pause(min(hint, MISTRAL_BACKOFF_MAX * 4))
+
+    def stats(self):
+        with self.lock:
+            out = dict(self.counters)
+        out.update({
+            "in_flight": self.concurrency.in_flight,
+            "waiting": len(self.concurrency.waiters),
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "rate_limit": self.bucket.rate or None,
+        })
+        return out
+
+_endpoints = {name: Endpoint(name) for name in ENDPOINTS}
+
+def endpoint(name):
+    return _endpoints[name]
+
+def call(name, fn, *args, **kwargs):
+    """Run a sync SDK call through the endpoint's limits, retrying transient failures."""
+    ep = _endpoints[name]
+    attempt = 0
+    while True:
+        t0 = time.perf_counter()
+        wait = ep.bucket.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        ep.concurrency.acquire()
+        ep.count("calls")
+        t1 = time.perf_counter()
+        MISTRAL_WAIT_SECONDS.observe(t1 - t0, endpoint=name)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as exc:
+            MISTRAL_SECONDS.observe(time.perf_counter() - t1, endpoint=name)
+            ep.concurrency.release()
+            ep._failed(exc)
+            if attempt >= MISTRAL_MAX_RETRIES or not is_retryable(exc):
+                ep.count("failed")
+                raise
+            time.sleep(backoff_delay(attempt, exc))
+            attempt += 1
+            ep.count("retries")
+            continue
+        except BaseException:
+            ep.concurrency.release()
+            raise
+        MISTRAL_SECONDS.observe(time.perf_counter() - t1, endpoint=name)
+        ep.concurrency.release()
+        ep.concurrency.on_success()
+        ep.count("succeeded")
+        return result
+
+async def acall(name, fn, *args, **kwargs):
+    """Async variant of call() for the SDK's *_async methods."""
+    ep = _endpoints[name]
+    attempt = 0
+    while True:
+        t0 = time.perf_counter()
+        wait = ep.bucket.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await ep.concurrency.acquire_async()
+        ep.count("calls")
+        t1 = time.perf_counter()
+        MISTRAL_WAIT_SECONDS.observe(t1 - t0, endpoint=name)
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as exc:
+            MISTRAL_SECONDS.observe(time.perf_counter() - t1, endpoint=name)
+            ep.concurrency.release()
+            ep._failed(exc)
+            if attempt >= MISTRAL_MAX_RETRIES or not is_retryable(exc):
+                ep.count("failed")
+                raise
+            await asyncio.sleep(backoff_delay(attempt, exc))
+            attempt += 1
+            ep.count("retries")
+            continue
+        except BaseException:
+            # cancelled while the request was in flight
+            ep.concurrency.release()
+            raise
+        MISTRAL_SECONDS.observe(time.perf_counter() - t1, endpoint=name)
+        ep.concurrency.release()
+        ep.concurrency.on_success()
+        ep.count("succeeded")
+        return result
+
+def gateway_stats():
+    return {name: ep.stats() for name, ep in _endpoints.items()}
@@ -0,0 +1,180 @@
+# app/jobqueue.py
+import os
+import json
+import time
+from datetime import datetime
+
+from .utils import get_db_conn
+from .artifacts import result_exists
+from .events import emit_status
+from .batches import child_finished
+
+QUEUE_LEASE_SECONDS = int(os.environ.get("QUEUE_LEASE_SECONDS", "120"))
+QUEUE_MAX_ATTEMPTS = int(os.environ.get("QUEUE_MAX_ATTEMPTS", "3"))
+# share of worker slots interactive uploads get relative to each running batch
+QUEUE_INTERACTIVE_WEIGHT = float(os.environ.get("QUEUE_INTERACTIVE_WEIGHT", "4"))
+
+def enqueue_job(job_id, payload: dict, lane=""):
+    """
+    Persist a job in the queue. payload holds the process_document keyword arguments; lane groups
+    jobs for fair scheduling ('' = interactive uploads, a batch id for batch children).
+    """
+    now = datetime.utcnow().isoformat()
+    conn = get_db_conn()
+    with conn:
+        conn.execute("""
+        INSERT OR REPLACE INTO job_queue(job_id, payload, status, attempts, lease_owner, lease_expires_at, enqueued_at, updated_at, last_error, lane)
+        VALUES (?, ?, 'queued', 0, NULL, NULL, ?, ?, NULL, ?)
+        """, (job_id, json.dumps(payload), now, now, lane or ""))
+    conn.close()
+
+def enqueue_jobs(items, lane=""):
+    """
+    Enqueue many (job_id, payload) pairs in one transaction (batch ingestion).
+    """
+    now = datetime.utcnow().isoformat()
+    conn = get_db_conn()
+    with conn:
+        conn.executemany("""
+        INSERT OR REPLACE INTO job_queue(job_id, payload, status, attempts, lease_owner, lease_expires_at, enqueued_at, updated_at, last_error, lane)
+        VALUES (?, ?, 'queued', 0, NULL, NULL, ?, ?, NULL, ?)
+        """, [(job_id, json.dumps(payload), now, now, lane or "") for job_id, payload in items])
+    conn.close()
+
+def _pick_lane(conn):
+    """
+    Lane to serve next: the one with the fewest leased jobs relative to its weight, oldest head
+    first on ties. A large batch therefore can't starve interactive uploads or other batches.
+    """
+    lanes = conn.execute("SELECT lane, MIN(enqueued_at) AS head FROM job_queue WHERE status = 'queued' GROUP BY lane").fetchall()
+    if len(lanes) <= 1:
+        return lanes[0]["lane"] if lanes else None
+    leased = {r["lane"]: r["n"] for r in conn.execute("SELECT lane, COUNT(*) AS n FROM job_queue WHERE status = 'leased' GROUP BY lane")}
+    def load(row):
+        weight = QUEUE_INTERACTIVE_WEIGHT if row["lane"] == "" else 1.0
+        return (leased.get(row["lane"], 0) / max(weight, 1e-9), row["head"])
+    return min(lanes, key=load)["lane"]
+
+def claim_job(worker_id, lease_seconds=QUEUE_LEASE_SECONDS):
+    """
+    Atomically lease the next job to worker_id (oldest job of the fairest lane).
+    Returns {"job_id", "payload", "attempts", "enqueued_at"} or None.
+    """
+    conn = get_db_conn()
+    try:
+        # BEGIN IMMEDIATE takes the write lock up front so two workers can't claim the same row
+        conn.execute("BEGIN IMMEDIATE")
+        lane = _pick_lane(conn)
+        if lane is None:
+            conn.commit()
+            return None
+        row = conn.execute("SELECT job_id, payload, attempts, enqueued_at FROM job_queue WHERE status = 'queued' AND lane = ? ORDER BY enqueued_at LIMIT 1", (lane,)).fetchone()
+        conn.execute("""
+        UPDATE job_queue SET status = 'leased', attempts = attempts + 1, lease_owner = ?, lease_expires_at = ?, updated_at = ?
+        WHERE job_id = ?
+        """, (worker_id, time.time() + lease_seconds, datetime.utcnow().isoformat(), row["job_id"]))
+        conn.commit()
+        return {"job_id": row["job_id"], "payload": json.loads(row["payload"] or "{}"), "attempts": row["attempts"] + 1, "enqueued_at": row["enqueued_at"]}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def heartbeat(job_ids, worker_id, lease_seconds=QUEUE_LEASE_SECONDS):
+    """
+    Extend the lease of jobs still held by worker_id. Returns the number of leases renewed.
+    """
+    if not job_ids:
+        return 0
+    conn = get_db_conn()
+    with conn:
+        cur = conn.executemany("""
+        UPDATE job_queue SET lease_expires_at = ?, updated_at = ?
+        WHERE job_id = ? AND lease_owner = ? AND status = 'leased'
+        """, [(time.time() + lease_seconds, datetime.utcnow().isoformat(), jid, worker_id) for jid in job_ids])
+        renewed = cur.rowcount
+    conn.close()
+    return renewed
+
+def finish_job(job_id, worker_id, status="done", error=None):
+    conn = get_db_conn()
+    with conn:
+        conn.execute("""
+        UPDATE job_queue SET status = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = ?, last_error = ?
+        WHERE job_id = ? AND lease_owner = ?
+        """, (status, datetime.utcnow().isoformat(), error, job_id, worker_id))
+    conn.close()
+
+def requeue_expired():
+    """
+    Put jobs whose lease ran out (worker crashed or was killed) back in the queue.
+    Jobs that already used QUEUE_MAX_ATTEMPTS are marked failed instead. Returns (requeued, failed).
+    """
+    now = time.time()
+    conn = get_db_conn()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute("SELECT job_id, attempts FROM job_queue WHERE status = 'leased' AND lease_expires_at < ?", (now,)).fetchall()
+        requeued, failed = 0, 0
+        transitions = []
+        ts = datetime.utcnow().isoformat()
+        for row in rows:
+            if row["attempts"] >= QUEUE_MAX_ATTEMPTS:
+                conn.execute("UPDATE job_queue SET status = 'failed', lease_owner = NULL, lease_expires_at = NULL, updated_at = ?, last_error = 'lease expired' WHERE job_id = ?", (ts, row["job_id"]))
+                conn.execute("UPDATE jobs SET status = 'failed', completed_at = ? WHERE job_id = ?", (ts, row["job_id"]))
+                failed += 1
+                transitions.append((row["job_id"], "failed"))
+            else:
+                conn.execute("UPDATE job_queue SET status = 'queued', lease_owner = NULL, lease_expires_at = NULL, updated_at = ? WHERE job_id = ?", (ts, row["job_id"]))
+                conn.execute("UPDATE jobs SET status = 'pending' WHERE job_id = ?", (row["job_id"],))
+                requeued += 1
+                transitions.append((row["job_id"], "pending"))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    for job_id, status in transitions:
+        emit_status(job_id, status, reason="lease expired")
+        if status == "failed":
+            child_finished(job_id)
+    return requeued, failed
+
+def recover_orphaned_jobs():
+    """
+    Enqueue jobs left 'pending' by older versions that scheduled work in memory only.
+    Their original options are unknown, so they are re-run with defaults.
+    """
+    conn = get_db_conn()
+    try:
+        rows = conn.execute("""
+        SELECT j.job_id, j.filepath, j.content_hash, j.batch_id FROM jobs j
+        LEFT JOIN job_queue q ON q.job_id = j.job_id
+        WHERE j.status IN ('pending', 'processing') AND q.job_id IS NULL
+        """).fetchall()
+    finally:
+        conn.close()
+    recovered = 0
+    for row in rows:
+        if result_exists(row["job_id"]):
+            continue
+        if not row["filepath"] or not os.path.exists(row["filepath"]):
+            continue
+        enqueue_job(row["job_id"], {"file_path": row["filepath"], "content_hash": row["content_hash"]}, lane=row["batch_id"] or "")
+        recovered += 1
+    return recovered
+
+def queue_stats():
+    conn = get_db_conn()
+    try:
+        rows = conn.execute("SELECT status, COUNT(*) AS n FROM job_queue GROUP BY status").fetchall()
+        stats = {r["status"]: r["n"] for r in rows}
+        lanes = conn.execute("SELECT lane, status, COUNT(*) AS n FROM job_queue WHERE status IN ('queued', 'leased') GROUP BY lane, status").fetchall()
+        stats["lanes"] = {}
+        for r in lanes:
+            stats["lanes"].setdefault(r["lane"] or "interactive", {})[r["status"]] = r["n"]
+        return stats
+    finally:
+        conn.close()
@@ -2,19 +2,34 @@
 import os
 import json
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import zipfile
+from datetime import datetime
 from io import BytesIO
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query
-from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
+from typing import List
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Query, Request
+from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
-from .utils import save_upload_file, result_path, init_db, insert_job, list_jobs, get_job, DB_PATH
-from .tasks import process_document
-from .mistral_client import client
-
-from docx import Document
+from .utils import save_upload_file_async, max_upload_bytes, UploadTooLarge, new_job_id, init_db, insert_job, list_jobs_page, get_job, close_db_pool, DB_PATH
+from .tasks import complete_from_cache
+from .jobqueue import enqueue_job, enqueue_jobs, requeue_expired, recover_orphaned_jobs, queue_stats
+from .worker import Worker
+from .sharding import read_pages
+from .artifacts import load_result, read_meta, update_meta, markdown_path, append_qna, PARTS
+from .events import emit_status, fetch_events, last_event_id, prune_events, Subscription, TERMINAL_STATUSES, EVENTS_POLL_INTERVAL
+from .cache import result_cache_key, lookup_result, cache_stats, qna_cache_key, lookup_answer, store_answer
+from .search import search
+from .render import document_markdown, cached_docx, DOCX_MEDIA_TYPE
+from .export import select_jobs, stream_zip
+from .procpool import run_async, shutdown_pool
+from .batches import create_batch, get_batch, batch_summary, list_batches, extract_zip, is_zip, new_batch_id, max_batch_bytes, BATCH_MAX_FILES
+from .retrieval import load_index, top_chunks, qna_messages, QNA_MODE, QNA_TOP_K, QNA_MAX_TOP_K
+from .mistral_client import get_async_client, close_async_client
+from .remote_files import signed_url_for_async, gc_remote_files
+from .gateway import acall, gateway_stats
+from .metrics import span, monitor_loop_lag, render as render_metrics, LOOP_LAG_INTERVAL, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 load_dotenv()
 
@@ -24,7 +39,45 @@ app = FastAPI(title="Mistral OCR Scanner — Final")
 FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend")
 app.mount("/static", StaticFiles(directory=os.path.join(FRONTEND_DIR)), name="static")
 
-# Allow CORS for development (same-origin not required)
+class UploadSizeLimit:
+    """
+    Reject oversized uploads before the body is read: by Content-Length when the client sends it,
+    otherwise as soon as the streamed body passes the limit (413 either way).
+    """
+    # room for multipart boundaries and the small form fields next to the file
+    SLACK = 64 * 1024
+
+    def __init__(self, app, limits=None):
+        self.app = app
+        # path -> callable returning the byte limit (None = unlimited)
+        self.limits = limits or {"/api/upload": max_upload_bytes, "/api/batch": max_batch_bytes}
+
+    async def __call__(self, scope, receive, send):
+        get_limit = self.limits.get(scope.get("path")) if scope["type"] == "http" and scope["method"] == "POST" else None
+        max_bytes = get_limit() if get_limit else None
+        if not max_bytes:
+            return await self.app(scope, receive, send)
+        limit = max_bytes + self.SLACK
+        length = dict(scope["headers"]).get(b"content-length")
+        if length and length.isdigit() and int(length) > limit:
+            resp = JSONResponse({"detail": f"Upload too large (max {max_bytes} bytes)"}, status_code=413)
+            return await resp(scope, receive, send)
+        received = 0
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # FastAPI re-raises HTTPExceptions from body parsing as-is
+                    raise HTTPException(status_code=413, detail=f"Upload too large (max {max_bytes} bytes)")
+            return message
+        await self.app(scope, limited_receive, send)
+
+app.add_middleware(UploadSizeLimit)
+
+# Allow CORS for development (same-origin not required). Added last so it is the outermost layer
+# and the 413 responses of UploadSizeLimit carry CORS headers too.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -36,24 +89,52 @@ app.add_middleware(
 # DB init (will create table and run migrations if needed)
 init_db()
 
-# executor will be created at startup
-executor = None
+# in-process queue worker will be created at startup (set EMBEDDED_WORKERS=0 to only use `python -m app.worker`)
+worker = None
+_background = set()
+
+async def _gc_remote_files():
+    # deletes remote uploads nobody used for REMOTE_FILE_TTL_DAYS; network bound, so off the startup path
+    try:
+        await asyncio.to_thread(gc_remote_files)
+    except Exception:
+        pass
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
 
 @app.on_event("startup")
 async def startup_event():
-    global executor
-    if executor is None:
-        maxw = int(os.environ.get("MAX_WORKERS", "3"))
-        executor = ThreadPoolExecutor(max_workers=maxw)
+    global worker
+    # jobs interrupted by a crash/restart go back to the queue
+    requeue_expired()
+    recover_orphaned_jobs()
+    prune_events()
+    _spawn(_gc_remote_files())
+    if LOOP_LAG_INTERVAL > 0:
+        _spawn(monitor_loop_lag())
+    if worker is None:
+        n = int(os.environ.get("EMBEDDED_WORKERS", os.environ.get("MAX_WORKERS", "3")))
+        if n > 0:
+            worker = Worker(concurrency=n)
+            worker.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    global executor
-    if executor:
+    global worker
+    for task in list(_background):
+        task.cancel()
+    if worker:
         try:
-            executor.shutdown(wait=False)
+            worker.stop(wait=False)
         except Exception:
             pass
+        worker = None
+    await close_async_client()
+    shutdown_pool()
+    close_db_pool()
 
 @app.get("/", response_class=HTMLResponse)
 async def index():
@@ -63,137 +144,468 @@ async def index():
     return HTMLResponse("<h3>Frontend not found. Put frontend/index.html in project.</h3>", status_code=404)
 
 @app.post("/api/upload")
-async def upload_document(file: UploadFile = File(...), do_annotations: bool = False, do_qna: bool = False, annotation_schema: str = None):
-    fp, job_id, original_name = save_upload_file(file)
-    size_bytes = os.path.getsize(fp)
+async def upload_document(file: UploadFile = File(...), do_annotations: bool = False, do_qna: bool = False, annotation_schema: str = None, sharded: bool = None):
+    annotation_schema_obj = None
+    if annotation_schema:
+        try:
+            annotation_schema_obj = json.loads(annotation_schema)
+        except Exception:
+            raise HTTPException(status_code=400, detail="annotation_schema must be valid JSON")
+
+    # streamed to disk without blocking the loop; hash and size come from the same pass
+    try:
+        fp, job_id, original_name, content_hash, size_bytes = await save_upload_file_async(file, max_upload_bytes())
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    # SQLite and cache work runs in a thread so status requests keep being answered meanwhile
+    return await asyncio.to_thread(_register_upload, job_id, original_name, fp, size_bytes, content_hash, {
+        "file_path": fp,
+        "do_annotations": do_annotations,
+        "annotation_schema": annotation_schema_obj,
+        "do_qna": do_qna,
+        "content_hash": content_hash,
+        "sharded": sharded,
+    })
+
+def _register_upload(job_id, original_name, fp, size_bytes, content_hash, payload):
     # insert job with empty title for now (will be set after processing)
-    insert_job(job_id, None, original_name, fp, size_bytes)
+    insert_job(job_id, None, original_name, fp, size_bytes, content_hash=content_hash)
+
+    # same content + options already processed: complete immediately from the cache
+    cached = lookup_result(result_cache_key(content_hash, payload["do_annotations"], payload["annotation_schema"], payload["do_qna"]))
+    if cached:
+        complete_from_cache(job_id, cached)
+        return {"job_id": job_id, "cached": True}
+
+    # persist the job in the queue; a worker (embedded or `python -m app.worker`) picks it up
+    enqueue_job(job_id, payload)
+    emit_status(job_id, "pending")
+    if worker:
+        worker.notify()
+    return {"job_id": job_id}
 
+def _parse_urls(urls):
+    if not urls:
+        return []
+    try:
+        parsed = json.loads(urls)
+        items = parsed if isinstance(parsed, list) else [parsed]
+    except ValueError:
+        items = urls.splitlines()
+    out = []
+    for u in (str(i).strip() for i in items):
+        if not u:
+            continue
+        if not u.lower().startswith(("http://", "https://")):
+            raise HTTPException(status_code=400, detail=f"not an http(s) URL: {u}")
+        out.append(u)
+    return out
+
+def _discard(children):
+    for c in children:
+        if c.get("filepath"):
+            try:
+                os.remove(c["filepath"])
+            except OSError:
+                pass
+
+@app.post("/api/batch")
+async def create_batch_endpoint(files: List[UploadFile] = File(None), urls: str = Form(None), name: str = Form(None), do_annotations: bool = False, do_qna: bool = False, annotation_schema: str = None, sharded: bool = None):
+    """
+    Ingest many documents at once: several files, ZIP archives (extracted member by member) and/or
+    `urls` (newline separated or a JSON list). Creates one batch with a child job per document.
+    """
     annotation_schema_obj = None
     if annotation_schema:
         try:
             annotation_schema_obj = json.loads(annotation_schema)
         except Exception:
             raise HTTPException(status_code=400, detail="annotation_schema must be valid JSON")
+    url_list = _parse_urls(urls)
 
-    loop = asyncio.get_running_loop()
-    # schedule processing in thread pool; non-blocking
-    loop.run_in_executor(executor, process_document, fp, None, job_id, do_annotations, annotation_schema_obj, do_qna)
-    return {"job_id": job_id}
+    children, skipped = [], []
+    try:
+        for f in files or []:
+            if is_zip(f):
+                zip_path, _, _, _, _ = await save_upload_file_async(f, max_batch_bytes())
+                try:
+                    # what the batch already stored counts against the same MAX_BATCH_MB budget
+                    budget = max_batch_bytes()
+                    if budget is not None:
+                        budget = max(0, budget - sum(c.get("size_bytes") or 0 for c in children))
+                    extracted, zip_skipped = await asyncio.to_thread(extract_zip, zip_path, max_upload_bytes(), BATCH_MAX_FILES - len(children), budget)
+                finally:
+                    os.remove(zip_path)
+                children.extend(extracted)
+                skipped.extend(zip_skipped)
+            else:
+                try:
+                    fp, job_id, original_name, content_hash, size_bytes = await save_upload_file_async(f, max_upload_bytes())
+                except UploadTooLarge:
+                    skipped.append({"filename": f.filename, "reason": "too large"})
+                    continue
+                children.append({"job_id": job_id, "filename": original_name, "filepath": fp, "size_bytes": size_bytes, "content_hash": content_hash})
+            if len(children) > BATCH_MAX_FILES:
+                raise HTTPException(status_code=400, detail=f"a batch holds at most {BATCH_MAX_FILES} documents")
+    except UploadTooLarge as e:
+        _discard(children)
+        raise HTTPException(status_code=413, detail=str(e))
+    except zipfile.BadZipFile:
+        _discard(children)
+        raise HTTPException(status_code=400, detail="invalid ZIP archive")
+    except HTTPException:
+        _discard(children)
+        raise
+    for u in url_list:
+        children.append({"job_id": new_job_id(), "filename": u, "document_url": u})
+    if not children:
+        raise HTTPException(status_code=400, detail="no documents in batch")
+    if len(children) > BATCH_MAX_FILES:
+        _discard(children)
+        raise HTTPException(status_code=400, detail=f"a batch holds at most {BATCH_MAX_FILES} documents")
+
+    options = {"do_annotations": do_annotations, "annotation_schema": annotation_schema_obj, "do_qna": do_qna, "sharded": sharded}
+    batch_id = new_batch_id()
+    await asyncio.to_thread(_register_batch, batch_id, name, children, options)
+    return {"batch_id": batch_id, "total": len(children), "job_ids": [c["job_id"] for c in children], "skipped": skipped}
+
+def _register_batch(batch_id, name, children, options):
+    create_batch(batch_id, name, children, options)
+    emit_status(batch_id, "pending", total=len(children))
+    queued = []
+    for c in children:
+        # documents seen before with the same options complete straight from the result cache
+        cached = lookup_result(result_cache_key(c.get("content_hash"), options["do_annotations"], options["annotation_schema"], options["do_qna"]))
+        if cached:
+            complete_from_cache(c["job_id"], cached)
+            continue
+        payload = {"do_annotations": options["do_annotations"], "annotation_schema": options["annotation_schema"],
+                   "do_qna": options["do_qna"], "content_hash": c.get("content_hash"), "sharded": options["sharded"]}
+        if c.get("filepath"):
+            payload["file_path"] = c["filepath"]
+        else:
+            payload["document_url"] = c["document_url"]
+        queued.append((c["job_id"], payload))
+    # children get the batch's own queue lane, so interactive uploads keep being served
+    enqueue_jobs(queued, lane=batch_id)
+    if worker:
+        worker.notify()
+
+@app.get("/api/batch/{batch_id}")
+async def api_batch(batch_id: str):
+    """Aggregate progress and throughput of a batch (one indexed query, children aren't read)."""
+    summary = await asyncio.to_thread(batch_summary, batch_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return summary
+
+@app.get("/api/batches")
+async def api_batches(limit: int = Query(50, ge=1, le=500)):
+    return {"batches": await asyncio.to_thread(list_batches, limit)}
+
+def _status_payload(job_id, job):
+    status = job.get("status") or "pending"
+    return {
+        "job_id": job_id,
+        "status": status,
+        "result_url": f"/api/result/{job_id}" if status in TERMINAL_STATUSES else None,
+        "pages_done": job.get("pages_done"),
+        "pages_total": job.get("pages_total"),
+    }
 
 @app.get("/api/status/{job_id}")
 async def job_status(job_id: str):
-    path = result_path(job_id)
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            try:
-                data = json.load(f)
-            except Exception:
-                data = {}
-        status = data.get("status", "completed") if isinstance(data, dict) else "completed"
-        return {"job_id": job_id, "status": status, "result_url": f"/api/result/{job_id}"}
-    return {"job_id": job_id, "status": "pending", "result_url": None}
+    # answered from the jobs table only; the (possibly large) result file is never opened here
+    job = await asyncio.to_thread(get_job, job_id) or {}
+    return _status_payload(job_id, job)
+
+def _sse(event, data, event_id=None):
+    frame = ""
+    if event_id is not None:
+        frame += f"id: {event_id}\n"
+    frame += f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+    return frame
+
+@app.get("/api/events/{job_id}")
+async def job_events(job_id: str, request: Request, after: int = None):
+    """
+    Server-Sent Events stream of a job: a 'status' snapshot first, then status / step / progress
+    events as the pipeline publishes them. The stream ends after a terminal status.
+    Reconnecting clients resume from the Last-Event-ID header (or ?after=<event id>).
+    """
+    job = await asyncio.to_thread(get_job, job_id)
+    # batch ids stream the batch's progress events the same way
+    snapshot_of = lambda: _status_payload(job_id, get_job(job_id) or {})
+    if not job:
+        if not await asyncio.to_thread(get_batch, job_id):
+            raise HTTPException(status_code=404, detail="Job not found")
+        snapshot_of = lambda: batch_summary(job_id)
+    resume = request.headers.get("last-event-id") or after
+    try:
+        cursor = int(resume) if resume is not None else None
+    except ValueError:
+        cursor = None
+
+    async def stream():
+        nonlocal cursor
+        with Subscription(job_id) as sub:
+            if cursor is None:
+                cursor = await asyncio.to_thread(last_event_id, job_id)
+                snapshot = await asyncio.to_thread(snapshot_of)
+                yield _sse("status", snapshot, cursor)
+                if snapshot.get("status") in TERMINAL_STATUSES:
+                    return
+            idle = 0.0
+            while True:
+                if await request.is_disconnected():
+                    return
+                events = await asyncio.to_thread(fetch_events, job_id, cursor)
+                for ev in events:
+                    cursor = ev["id"]
+                    yield _sse(ev["event"], ev["data"], ev["id"])
+                    if ev["event"] == "status" and ev["data"].get("status") in TERMINAL_STATUSES:
+                        return
+                if events:
+                    idle = 0.0
+                    continue
+                # local emits wake us immediately; workers in other processes are seen on the next poll
+                await sub.wait(EVENTS_POLL_INTERVAL)
+                idle += EVENTS_POLL_INTERVAL
+                if idle >= 15:
+                    idle = 0.0
+                    yield ": keep-alive\n\n"
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=headers)
 
 @app.get("/api/result/{job_id}")
-async def get_result(job_id: str):
-    path = result_path(job_id)
-    if not os.path.exists(path):
+async def get_result(job_id: str, include: str = None):
+    """
+    Combined result view reassembled from the job's artifacts. `include` is a comma separated
+    subset of meta,markdown,ocr,annotations,qna (default: everything).
+    """
+    parts = PARTS
+    if include:
+        parts = tuple(p.strip() for p in include.split(",") if p.strip() in PARTS)
+    # the OCR payload can be large: decompress/parse off the event loop
+    result = await asyncio.to_thread(load_result, job_id, parts)
+    if result is None:
         raise HTTPException(status_code=404, detail="Result not ready")
-    # Return JSON file for debugging; frontend won't show raw JSON by default
-    return FileResponse(path, media_type="application/json", filename=f"{job_id}.json")
+    # Return JSON for debugging; frontend won't show raw JSON by default
+    return JSONResponse(result, headers={"Content-Disposition": f"inline; filename={job_id}.json"})
+
+@app.get("/api/result/{job_id}/pages")
+async def get_result_pages(job_id: str, since: int = 0):
+    """Per-page markdown persisted so far (sharded OCR), usable while the job is still running."""
+    job = await asyncio.to_thread(get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "job_id": job_id,
+        "status": job.get("status"),
+        "pages_done": job.get("pages_done"),
+        "pages_total": job.get("pages_total"),
+        "pages": await asyncio.to_thread(read_pages, job_id, since),
+    }
 
 @app.get("/api/jobs")
-async def api_jobs(limit: int = 100):
-    rows = list_jobs(limit=limit)
-    return {"jobs": rows, "db": str(DB_PATH)}
+async def api_jobs(limit: int = Query(100, ge=1, le=1000), cursor: str = None, status: str = None, created_from: str = None, created_to: str = None, batch_id: str = None):
+    """
+    Newest jobs first. Pass the returned next_cursor back as ?cursor= for the next page;
+    status / created_from / created_to (ISO timestamps, [from, to)) / batch_id filter the listing.
+    """
+    try:
+        rows, next_cursor = await asyncio.to_thread(list_jobs_page, limit, cursor, status, created_from, created_to, batch_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"jobs": rows, "next_cursor": next_cursor, "db": str(DB_PATH)}
+
+@app.get("/api/queue")
+async def api_queue():
+    return {"queue": await asyncio.to_thread(queue_stats)}
+
+@app.get("/api/cache/stats")
+async def api_cache_stats():
+    return await asyncio.to_thread(cache_stats)
+
+@app.get("/api/gateway/stats")
+async def api_gateway_stats():
+    return gateway_stats()
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint (stage / Mistral / job latency histograms, queue depth, throughput)."""
+    body = await asyncio.to_thread(render_metrics)
+    return Response(content=body, media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/api/search")
+async def api_search(q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=200), offset: int = Query(0, ge=0)):
+    """
+    Full-text search over titles and markdown of completed documents, best matches first.
+    """
+    hits = await asyncio.to_thread(search, q, limit, offset)
+    return {"query": q, "results": hits}
+
+async def _qna_document_url(job_id, doc):
+    job = await asyncio.to_thread(get_job, job_id)
+    if job and job.get("content_hash"):
+        # uploaded file: the stored signed URL may have expired, the registry refreshes it
+        # (or re-uploads if the remote file is gone)
+        try:
+            return await signed_url_for_async(job.get("filepath"), job["content_hash"])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to upload file for QnA: {e}")
+    doc_url = doc.get("document_url")
+    if doc_url:
+        return doc_url
+    if not job:
+        raise HTTPException(status_code=400, detail="No job record found and no document_url in result")
+    filepath = job.get("filepath")
+    if not filepath or not os.path.exists(filepath):
+        raise HTTPException(status_code=400, detail="Document URL not available for QnA — run job with do_qna=True or upload as URL")
+    try:
+        doc_url = await signed_url_for_async(filepath)
+        await asyncio.to_thread(update_meta, job_id, document_url=doc_url)
+        return doc_url
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to upload file for QnA: {e}")
+
+def _qna_top_k(value):
+    if value is None:
+        return QNA_TOP_K
+    try:
+        # JSON numbers or numeric strings; bools and fractions are rejected
+        if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+            raise ValueError
+        top_k = int(value)
+    except (TypeError, ValueError):
+        top_k = None
+    if top_k is None or not 1 <= top_k <= QNA_MAX_TOP_K:
+        raise HTTPException(status_code=400, detail=f"top_k must be an integer from 1 to {QNA_MAX_TOP_K}")
+    return top_k
 
 @app.post("/api/qna")
 async def qna(body: dict):
+    """
+    mode "chunks" (default, QNA_MODE) sends only the top_k best matching chunks of the stored
+    markdown; mode "document" sends the whole document URL. Chunk mode falls back to the document
+    when the job has no markdown or nothing in it matches the question.
+    Answers are cached per (document content, model, mode, top_k, normalized question); "no_cache": true
+    skips the cache lookup for this request.
+    """
     job_id = body.get("job_id")
     question = body.get("question")
     if not job_id or not question:
         raise HTTPException(status_code=400, detail="job_id and question required")
+    mode = body.get("mode") or QNA_MODE
+    if mode not in ("chunks", "document"):
+        raise HTTPException(status_code=400, detail="mode must be 'chunks' or 'document'")
+    top_k = _qna_top_k(body.get("top_k"))
 
-    path = result_path(job_id)
-    if not os.path.exists(path):
+    # only the small metadata artifact is needed here (reading it may migrate a legacy result)
+    doc = await asyncio.to_thread(read_meta, job_id)
+    if doc is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    with open(path, "r", encoding="utf-8") as f:
-        try:
-            doc = json.load(f)
-        except Exception:
-            doc = {}
+    model = os.environ.get("DOC_QNA_MODEL","mistral-small-latest")
+    job = await asyncio.to_thread(get_job, job_id)
+    # documents without a content hash (URL jobs) are cached per job
+    content_hash = (job or {}).get("content_hash") or f"job:{job_id}"
+    cache_key = qna_cache_key(content_hash, model, question, mode, top_k)
+    if not body.get("no_cache"):
+        with span("qna.cache_lookup"):
+            cached = await asyncio.to_thread(lookup_answer, cache_key)
+        if cached is not None:
+            entry = {"question": question, "answer": cached["answer"], "mode": cached.get("mode", mode), "sources": cached.get("sources", []), "cached": True}
+            try:
+                await asyncio.to_thread(append_qna, job_id, entry)
+            except Exception:
+                pass
+            return {"answer": entry["answer"], "mode": entry["mode"], "sources": entry["sources"], "cached": True}
 
-    doc_url = doc.get("document_url")
-    if not doc_url:
-        job = get_job(job_id)
-        if not job:
-            raise HTTPException(status_code=400, detail="No job record found and no document_url in result")
-        filepath = job.get("filepath")
-        if not filepath or not os.path.exists(filepath):
-            raise HTTPException(status_code=400, detail="Document URL not available for QnA — run job with do_qna=True or upload as URL")
-        try:
-            up = client.files.upload(file={"file_name": os.path.basename(filepath), "content": open(filepath, "rb")}, purpose="ocr")
-            signed_obj = client.files.get_signed_url(file_id=up.id)
-            doc_url = signed_obj.url
-            doc["document_url"] = doc_url
-            with open(path, "w", encoding="utf-8") as f:
-                json.dump(doc, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to upload file for QnA: {e}")
+    hits = []
+    if mode == "chunks":
+        with span("qna.retrieve"):
+            index = await asyncio.to_thread(load_index, job_id)
+            if index:
+                hits = top_chunks(index, question, top_k)
+        if not hits:
+            mode = "document"
 
-    try:
+    # async SDK calls over the pooled client: the event loop keeps serving other requests meanwhile
+    aclient = get_async_client()
+    if mode == "chunks":
+        messages = qna_messages(question, hits)
+    else:
+        with span("qna.document_url"):
+            doc_url = await _qna_document_url(job_id, doc)
         messages = [{"role":"user","content":[{"type":"text","text": question},{"type":"document_url","document_url":doc_url}]}]
-        chat_response = client.chat.complete(model=os.environ.get("DOC_QNA_MODEL","mistral-small-latest"), messages=messages)
+
+    try:
+        with span("qna.chat"):
+            chat_response = await acall("chat", aclient.chat.complete_async, model=model, messages=messages)
         answer = chat_response.choices[0].message.content
-        # persist qna
+        sources = [{"chunk": h["chunk"], "score": h["score"]} for h in hits]
+        # persist qna: one appended line, the rest of the result is untouched
         try:
-            doc.setdefault("qna_history", []).append({"question": question, "answer": answer})
-            with open(path, "w", encoding="utf-8") as f:
-                json.dump(doc, f, ensure_ascii=False, indent=2)
+            await asyncio.to_thread(append_qna, job_id, {"question": question, "answer": answer, "mode": mode, "sources": sources})
         except Exception:
             pass
-        return {"answer": answer}
+        try:
+            await asyncio.to_thread(store_answer, cache_key, content_hash, model, question, answer, mode=mode, sources=sources)
+        except Exception:
+            pass
+        return {"answer": answer, "mode": mode, "sources": sources, "cached": False}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"QnA failed: {e}")
 
 @app.get("/api/download/{job_id}")
-async def api_download(job_id: str, format: str = Query("md", regex="^(md|docx)$")):
-    path = result_path(job_id)
-    if not os.path.exists(path):
+async def api_download(job_id: str, format: str = Query("md", pattern="^(md|docx)$")):
+    doc = await asyncio.to_thread(read_meta, job_id)
+    if doc is None:
         raise HTTPException(status_code=404, detail="Result not ready")
-    with open(path, "r", encoding="utf-8") as f:
-        doc = json.load(f)
-    # prefer stored full_markdown
-    markdown = doc.get("full_markdown") or doc.get("qna_summary") or None
-    if not markdown:
-        # try to extract from result['ocr'] crudely
-        markdown = doc.get("title", "") + "\n\n" + (doc.get("qna_summary") or "")
+    md_path = await asyncio.to_thread(markdown_path, job_id)
+    if format == "md" and md_path:
+        # stored full_markdown is served straight from disk
+        return FileResponse(md_path, media_type="text/markdown", filename=f"{job_id}.md")
     if format == "md":
-        data = markdown.encode("utf-8")
+        data = document_markdown(doc, None).encode("utf-8")
         return StreamingResponse(BytesIO(data), media_type="text/markdown", headers={"Content-Disposition": f"attachment; filename={job_id}.md"})
-    else:
-        # build simple docx
-        document = Document()
-        # Title
-        title = doc.get("title") or ""
-        if title:
-            p = document.add_paragraph()
-            run = p.add_run(title)
-            run.bold = True
-        # naive markdown -> paragraphs conversion
-        for line in markdown.splitlines():
-            line = line.rstrip()
-            if line.startswith("#"):
-                # heading level
-                level = len(line.split(" ")[0].strip("#"))
-                text = line[level+1:].strip() if len(line.split(" "))>1 else line.lstrip("#").strip()
-                p = document.add_paragraph()
-                r = p.add_run(text)
-                r.bold = True
-            else:
-                document.add_paragraph(line)
-        bio = BytesIO()
-        document.save(bio)
-        bio.seek(0)
-        return StreamingResponse(bio, media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document", headers={"Content-Disposition": f"attachment; filename={job_id}.docx"})
+    # rendered .docx files are cached per result: repeats are plain file responses
+    with span("download.docx_lookup"):
+        path = await asyncio.to_thread(cached_docx, job_id, False)
+    if path is None:
+        # python-docx is CPU bound: render in the process pool, off the event loop
+        with span("download.docx_render"):
+            path = await run_async(cached_docx, job_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Result not ready")
+    return FileResponse(path, media_type=DOCX_MEDIA_TYPE, filename=f"{job_id}.docx")
+
+def _export_response(format, job_ids, created_from, created_to, q, limit):
+    if format not in ("md", "docx"):
+        raise HTTPException(status_code=400, detail="format must be md or docx")
+    if not (job_ids or created_from or created_to or q):
+        raise HTTPException(status_code=400, detail="select documents with job_ids, created_from / created_to or q")
+    jobs = select_jobs(job_ids=job_ids, created_from=created_from, created_to=created_to, query=q, limit=limit)
+    name = f"export-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.zip"
+    return StreamingResponse(stream_zip(jobs, format), media_type="application/zip", headers={"Content-Disposition": f"attachment; filename={name}"})
+
+@app.get("/api/export")
+async def api_export(format: str = "md", job_ids: str = None, created_from: str = None, created_to: str = None, q: str = None, limit: int = Query(None, ge=1)):
+    """
+    Stream a ZIP of completed results (Markdown or DOCX) selected by comma-separated job_ids,
+    a created_at range [created_from, created_to) or a full-text query q.
+    """
+    ids = [i.strip() for i in job_ids.split(",") if i.strip()] if job_ids else None
+    return _export_response(format, ids, created_from, created_to, q, limit)
+
+@app.post("/api/export")
+async def api_export_post(body: dict):
+    """Same as GET /api/export, for long job id lists: {"job_ids": [...], "format", "created_from", "created_to", "q", "limit"}."""
+    ids = body.get("job_ids")
+    if ids is not None and not isinstance(ids, list):
+        raise HTTPException(status_code=400, detail="job_ids must be a list")
+    return _export_response(body.get("format") or "md", ids, body.get("created_from"), body.get("created_to"), body.get("q"), body.get("limit"))
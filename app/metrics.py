@@ -0,0 +1,237 @@
+# app/metrics.py
+"""
+In-process metrics in the Prometheus text format, served by GET /metrics (and by
+`python -m app.worker --metrics-port N` for standalone workers, whose jobs run in another process).
+
+Timings come from spans: pipeline stages (run time and the wait between becoming runnable and
+starting, i.e. executor queueing), every Mistral request, job totals and queue wait, and named
+spans of the request handlers (span("qna.chat"), ...). Queue depth, in-flight jobs and pages/sec
+are read from SQLite when scraped, so they are the same whichever process answers.
+"""
+import os
+import time
+import asyncio
+import threading
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from .utils import get_db_conn
+
+# seconds; OCR calls of large documents take minutes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# window used for the pages / jobs per second gauges
+METRICS_RATE_WINDOW = int(os.environ.get("METRICS_RATE_WINDOW", "300"))
+# how often the API samples its event loop lag (seconds, 0 = off)
+LOOP_LAG_INTERVAL = float(os.environ.get("LOOP_LAG_INTERVAL", "0.1"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+_collectors = []
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in zip(names, values)) + "}"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _num(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(self.labelnames, key)} {_num(value)}"
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # one slot per bucket plus +Inf, then sum
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[i] += 1
+            counts[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self.lock:
+            items = sorted((k, list(v)) for k, v in self.values.items())
+        for key, counts in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts[:-1]):
+                cumulative += n
+                yield f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + (_num(float(bound)),))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_num(counts[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+def collector(fn):
+    """Register fn() -> [(name, type, help, [(labels dict, value)])] evaluated on every scrape."""
+    _collectors.append(fn)
+    return fn
+
+STAGE_SECONDS = Histogram("ocr_stage_duration_seconds", "Run time of pipeline stages.", ("stage",))
+STAGE_WAIT_SECONDS = Histogram("ocr_stage_wait_seconds", "Time between a stage becoming runnable and starting (executor queueing).", ("stage",))
+STAGE_ERRORS = Counter("ocr_stage_errors_total", "Failed pipeline stages.", ("stage",))
+JOB_SECONDS = Histogram("ocr_job_duration_seconds", "Processing time of jobs from pipeline start to saved result (status: completed, failed, cached).", ("status",))
+JOB_QUEUE_SECONDS = Histogram("ocr_job_queue_wait_seconds", "Time jobs waited in the queue before a worker claimed them.")
+JOBS_FINISHED = Counter("ocr_jobs_finished_total", "Jobs finished by this process.", ("status",))
+PAGES = Counter("ocr_pages_processed_total", "Pages OCRed by this process.")
+MISTRAL_SECONDS = Histogram("ocr_mistral_request_duration_seconds", "Duration of single Mistral API requests (one attempt).", ("endpoint",))
+MISTRAL_WAIT_SECONDS = Histogram("ocr_mistral_wait_seconds", "Time Mistral calls waited for the rate limit and concurrency slots.", ("endpoint",))
+SPAN_SECONDS = Histogram("ocr_span_duration_seconds", "Duration of named spans (request handlers, result persistence).", ("span",))
+SPAN_ERRORS = Counter("ocr_span_errors_total", "Spans that raised.", ("span",))
+LOOP_LAG_SECONDS = Histogram("ocr_event_loop_lag_seconds", "How late the API event loop ran a timer (blocking work on the loop).",
+                             buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+PREPROCESS_SECONDS = Histogram("ocr_preprocess_duration_seconds", "Time spent optimizing files before upload (PREPROCESS).")
+PREPROCESS_SAVED_BYTES = Counter("ocr_preprocess_saved_bytes_total", "Upload bytes saved by pre-upload optimization.")
+
+def observe_stage(name, seconds, wait=None, error=False):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    if wait is not None:
+        STAGE_WAIT_SECONDS.observe(wait, stage=name)
+    if error:
+        STAGE_ERRORS.inc(stage=name)
+
+@contextmanager
+def span(name, timings=None):
+    """
+    Time a block into ocr_span_duration_seconds{span=name}; with a timings dict, also store the
+    duration there under name.
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        SPAN_ERRORS.inc(span=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - t0
+        SPAN_SECONDS.observe(elapsed, span=name)
+        if timings is not None:
+            timings[name] = round(elapsed, 4)
+
+async def monitor_loop_lag(interval=LOOP_LAG_INTERVAL):
+    """Sample the running loop's lag forever: a sleep that returns late means the loop was blocked."""
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        LOOP_LAG_SECONDS.observe(max(0.0, time.perf_counter() - t0 - interval))
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        # no procfs: peak RSS instead (kilobytes on Linux, bytes on macOS)
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for fn in _collectors:
+        try:
+            families = fn()
+        except Exception:
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_num(value)}")
+    return "\n".join(lines) + "\n"
+
+@collector
+def _queue_metrics():
+    since = (datetime.utcnow() - timedelta(seconds=METRICS_RATE_WINDOW)).isoformat()
+    conn = get_db_conn()
+    try:
+        queue = conn.execute("SELECT status, COUNT(*) AS n FROM job_queue GROUP BY status").fetchall()
+        lanes = conn.execute("SELECT COUNT(DISTINCT lane) AS n FROM job_queue WHERE status IN ('queued', 'leased')").fetchone()["n"]
+        done = conn.execute("SELECT status, COUNT(*) AS n, COALESCE(SUM(pages), 0) AS pages FROM jobs WHERE completed_at >= ? GROUP BY status", (since,)).fetchall()
+    finally:
+        conn.close()
+    states = {r["status"]: r["n"] for r in queue}
+    completed = next((r for r in done if r["status"] == "completed"), None)
+    return [
+        ("ocr_queue_jobs", "gauge", "Jobs in the durable queue by state.", [({"state": s}, states.get(s, 0)) for s in ("queued", "leased", "done", "failed")]),
+        ("ocr_jobs_in_flight", "gauge", "Jobs currently leased by a worker (all processes).", [({}, states.get("leased", 0))]),
+        ("ocr_queue_active_lanes", "gauge", "Lanes (interactive + batches) with queued or leased jobs.", [({}, lanes)]),
+        ("ocr_pages_per_second", "gauge", f"Pages completed per second over the last {METRICS_RATE_WINDOW}s (all processes).",
+         [({}, round((completed["pages"] if completed else 0) / METRICS_RATE_WINDOW, 4))]),
+        ("ocr_jobs_per_second", "gauge", f"Jobs finished per second over the last {METRICS_RATE_WINDOW}s (all processes).",
+         [({"status": r["status"]}, round(r["n"] / METRICS_RATE_WINDOW, 4)) for r in done]),
+    ]
+
+@collector
+def _process_metrics():
+    return [("process_resident_memory_bytes", "gauge", "Resident memory of this process.", [({}, rss_bytes())])]
+
+@collector
+def _gateway_metrics():
+    # lazy: the gateway itself records into this module
+    from .gateway import gateway_stats
+    stats = gateway_stats()
+    return [
+        ("ocr_mistral_in_flight", "gauge", "Mistral requests in flight in this process.", [({"endpoint": e}, s["in_flight"]) for e, s in stats.items()]),
+        ("ocr_mistral_waiting", "gauge", "Mistral calls waiting for a concurrency slot in this process.", [({"endpoint": e}, s["waiting"]) for e, s in stats.items()]),
+        ("ocr_mistral_concurrency_limit", "gauge", "Current adaptive concurrency limit.", [({"endpoint": e}, s["concurrency_limit"]) for e, s in stats.items()]),
+        ("ocr_mistral_calls_total", "counter", "Mistral calls by outcome (calls, succeeded, failed, retries, throttled).",
+         [({"endpoint": e, "outcome": k}, s[k]) for e, s in stats.items() for k in ("calls", "succeeded", "failed", "retries", "throttled")]),
+    ]
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port, host="0.0.0.0"):
+    """Serve /metrics from a daemon thread (standalone workers)."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,203 @@
+# app/pipeline.py
+"""
+Tiny dependency-graph runner for the document pipeline.
+
+A stage declares the stages it requires; every stage whose requirements are satisfied runs
+concurrently (threads for the sync runner, tasks for the async one). A failing stage is recorded
+in ctx.result["steps"] / ctx.result["errors"] and only its dependents are skipped, unless the
+stage is marked critical, in which case its exception is re-raised once the running stages
+have settled.
+
+Every stage is timed: ctx.timings[name] is its run time and ctx.stage_waits[name] the time it
+spent queued between becoming runnable and starting (both in seconds, also exported as metrics).
+
+New stages are added with the @stage decorator from any module, e.g.
+
+    @stage("language", requires=("ocr",))
+    def detect_language(ctx):
+        ctx.result["language"] = guess(ctx.full_markdown)
+
+Modules listed in PIPELINE_PLUGINS (comma separated) are imported by app.tasks so their stages
+get registered without touching the core pipeline.
+"""
+import time
+import asyncio
+import inspect
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .metrics import observe_stage
+
+class Stage:
+    def __init__(self, name, fn, requires=(), when=None, critical=False, step=None):
+        self.name = name
+        self.fn = fn
+        self.afn = None
+        self.requires = tuple(requires)
+        self.when = when
+        self.critical = critical
+        self.step = step or f"{name}_done"
+
+    def enabled(self, ctx):
+        return self.when is None or bool(self.when(ctx))
+
+class JobContext:
+    """Mutable state shared by the stages of one job."""
+    def __init__(self, job_id=None, **params):
+        self.job_id = job_id
+        self.result = {"job_id": job_id, "steps": []}
+        self.timings = {}
+        self.stage_waits = {}
+        self.__dict__.update(params)
+
+    def __getattr__(self, name):
+        # unset optional fields read as None
+        return None
+
+STAGES = {}
+
+def stage(name, requires=(), when=None, critical=False, step=None):
+    """Register a sync stage. Use @<fn>.async_impl to add a native coroutine variant."""
+    def deco(fn):
+        st = Stage(name, fn, requires, when, critical, step)
+        STAGES[name] = st
+        def async_impl(afn):
+            st.afn = afn
+            return afn
+        fn.async_impl = async_impl
+        return fn
+    return deco
+
+def _ordered(stages):
+    stages = list(stages if stages is not None else STAGES.values())
+    names = {s.name for s in stages}
+    for s in stages:
+        missing = [r for r in s.requires if r not in names]
+        if missing:
+            raise ValueError(f"stage '{s.name}' requires unknown stage(s): {', '.join(missing)}")
+    return stages
+
+def _notify(ctx, name, status):
+    # ctx.on_step(ctx, stage_name, status) lets the caller publish progress; it must not break the run
+    if ctx.on_step:
+        try:
+            ctx.on_step(ctx, name, status)
+        except Exception:
+            pass
+
+def _timed(fn, st, ctx, queued_at):
+    started = time.perf_counter()
+    ctx.stage_waits[st.name] = round(started - queued_at, 4)
+    try:
+        return fn(ctx)
+    finally:
+        ctx.timings[st.name] = round(time.perf_counter() - started, 4)
+
+async def _timed_async(afn, st, ctx, queued_at):
+    started = time.perf_counter()
+    ctx.stage_waits[st.name] = round(started - queued_at, 4)
+    try:
+        return await afn(ctx)
+    finally:
+        ctx.timings[st.name] = round(time.perf_counter() - started, 4)
+
+def _record(ctx, st, error=None):
+    observe_stage(st.name, ctx.timings.get(st.name, 0.0), ctx.stage_waits.get(st.name), error is not None)
+    if error is None:
+        ctx.result["steps"].append(st.step)
+        _notify(ctx, st.name, "done")
+    else:
+        ctx.result["steps"].append(f"{st.name}_failed")
+        ctx.result.setdefault("errors", {})[st.name] = str(error)
+        _notify(ctx, st.name, "failed")
+
+def _next_ready(pending, done, blocked, ctx):
+    """
+    Pop the stages that can start now. Stages depending on a failed, skipped or disabled
+    stage are skipped; disabled stages (when(ctx) is false) block their dependents silently.
+    """
+    ready = []
+    changed = True
+    while changed:
+        changed = False
+        for st in list(pending):
+            if any(r in blocked for r in st.requires):
+                pending.remove(st)
+                blocked.add(st.name)
+                if st.enabled(ctx):
+                    ctx.result["steps"].append(f"{st.name}_skipped")
+                    _notify(ctx, st.name, "skipped")
+                changed = True
+            elif all(r in done for r in st.requires):
+                pending.remove(st)
+                if st.enabled(ctx):
+                    ready.append(st)
+                    _notify(ctx, st.name, "started")
+                else:
+                    blocked.add(st.name)
+                changed = True
+    return ready
+
+def run_stages(ctx, stages=None, max_workers=None):
+    """Run the stage graph with a thread per concurrently runnable stage."""
+    pending = _ordered(stages)
+    done, failed, critical = set(), set(), None
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers or max(1, len(pending))) as pool:
+        while pending or running:
+            for st in _next_ready(pending, done, failed, ctx):
+                running[pool.submit(_timed, st.fn, st, ctx, time.perf_counter())] = st
+            if not running:
+                break
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                st = running.pop(fut)
+                err = fut.exception()
+                _record(ctx, st, err)
+                if err is None:
+                    done.add(st.name)
+                else:
+                    failed.add(st.name)
+                    if st.critical and critical is None:
+                        critical = err
+            if critical is not None:
+                # don't start anything new, let running stages settle
+                pending = []
+    if critical is not None:
+        raise critical
+    return ctx
+
+async def _run_async_stage(st, ctx):
+    queued_at = time.perf_counter()
+    if st.afn is not None:
+        return await _timed_async(st.afn, st, ctx, queued_at)
+    if inspect.iscoroutinefunction(st.fn):
+        return await _timed_async(st.fn, st, ctx, queued_at)
+    # the wait of a sync stage includes the default executor's queue
+    return await asyncio.to_thread(_timed, st.fn, st, ctx, queued_at)
+
+async def run_stages_async(ctx, stages=None):
+    """Run the stage graph on the running event loop; sync-only stages go to a thread."""
+    pending = _ordered(stages)
+    done, failed, critical = set(), set(), None
+    running = {}
+    while pending or running:
+        for st in _next_ready(pending, done, failed, ctx):
+            running[asyncio.ensure_future(_run_async_stage(st, ctx))] = st
+        if not running:
+            break
+        finished, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+        for fut in finished:
+            st = running.pop(fut)
+            err = fut.exception()
+            _record(ctx, st, err)
+            if err is None:
+                done.add(st.name)
+            else:
+                failed.add(st.name)
+                if st.critical and critical is None:
+                    critical = err
+        if critical is not None:
+            pending = []
+    if critical is not None:
+        raise critical
+    return ctx
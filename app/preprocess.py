@@ -0,0 +1,216 @@
+# app/preprocess.py
+"""
+Optional optimization of local files before they are uploaded to Mistral (PREPROCESS=1). Phone
+photos and high-dpi scans are auto-rotated by their EXIF orientation, downscaled to
+PREPROCESS_TARGET_DPI (and at most PREPROCESS_MAX_SIDE pixels), stripped of metadata and re-encoded
+(JPEG, or PNG for bilevel scans). With PREPROCESS_PDF=1, images embedded in PDFs are downscaled the
+same way and the PDF is recompressed.
+
+Needs Pillow (and pypdf for PDFs); without them files are uploaded unchanged. The work runs in the
+shared process pool (app.procpool). The original file is never modified: a temporary copy is
+uploaded, and it is only used when it is actually smaller (or had to be rotated).
+"""
+import os
+import time
+import logging
+import tempfile
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional dependency
+    Image = None
+
+try:
+    from pypdf import PdfWriter
+except ImportError:  # optional dependency
+    PdfWriter = None
+
+from .procpool import run, run_async
+from .metrics import PREPROCESS_SECONDS, PREPROCESS_SAVED_BYTES
+
+PREPROCESS = os.environ.get("PREPROCESS", "0").lower() in ("1", "true", "yes")
+PREPROCESS_PDF = os.environ.get("PREPROCESS_PDF", "0").lower() in ("1", "true", "yes")
+PREPROCESS_TARGET_DPI = int(os.environ.get("PREPROCESS_TARGET_DPI", "200"))
+PREPROCESS_MAX_SIDE = int(os.environ.get("PREPROCESS_MAX_SIDE", "3000"))
+PREPROCESS_JPEG_QUALITY = int(os.environ.get("PREPROCESS_JPEG_QUALITY", "85"))
+# smaller files are uploaded as they are
+PREPROCESS_MIN_KB = int(os.environ.get("PREPROCESS_MIN_KB", "256"))
+
+log = logging.getLogger("app.preprocess")
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tif", ".tiff", ".webp", ".bmp"}
+
+def enabled_for(path):
+    if not PREPROCESS or not path or Image is None:
+        return False
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".pdf":
+        if not PREPROCESS_PDF or PdfWriter is None:
+            return False
+    elif ext not in IMAGE_EXTENSIONS:
+        return False
+    try:
+        return os.path.getsize(path) >= PREPROCESS_MIN_KB * 1024
+    except OSError:
+        return False
+
+def _scale(width, height, dpi=None):
+    """Downscale factor (<= 1) for an image of width x height pixels scanned at dpi."""
+    scale = 1.0
+    if dpi and dpi > PREPROCESS_TARGET_DPI:
+        scale = PREPROCESS_TARGET_DPI / dpi
+    longest = max(width, height) * scale
+    if PREPROCESS_MAX_SIDE and longest > PREPROCESS_MAX_SIDE:
+        scale *= PREPROCESS_MAX_SIDE / longest
+    return scale
+
+def _flatten(img):
+    # JPEG has no alpha: composite on white, as a printed page would be
+    if img.mode in ("RGBA", "LA", "P", "PA"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, "white")
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    if img.mode not in ("RGB", "L"):
+        return img.convert("RGB")
+    return img
+
+def _tempfile(src, ext):
+    fd, path = tempfile.mkstemp(prefix=".prep-", suffix=ext, dir=os.path.dirname(os.path.abspath(src)))
+    os.close(fd)
+    return path
+
+def optimize_image(src, actions):
+    with Image.open(src) as img:
+        if getattr(img, "n_frames", 1) > 1:
+            # multi-page TIFF / animations: not worth flattening to one frame
+            return None
+        dpi = img.info.get("dpi")
+        dpi = max(dpi) if dpi else None
+        if img.getexif().get(0x0112, 1) != 1:
+            actions.append("rotated")
+        img = ImageOps.exif_transpose(img)
+        scale = _scale(img.width, img.height, dpi)
+        if scale < 1.0:
+            img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.LANCZOS)
+            dpi = dpi * scale if dpi else None
+            actions.append("downscaled")
+        save = {"dpi": (round(dpi), round(dpi))} if dpi else {}
+        # no exif / icc_profile passed on: metadata is dropped
+        if img.mode == "1":
+            dst = _tempfile(src, ".png")
+            img.save(dst, "PNG", optimize=True, **save)
+        else:
+            dst = _tempfile(src, ".jpg")
+            _flatten(img).save(dst, "JPEG", quality=PREPROCESS_JPEG_QUALITY, optimize=True, **save)
+        actions.append("reencoded")
+    return dst
+
+def optimize_pdf(src, actions):
+    writer = PdfWriter(clone_from=src)
+    for page in writer.pages:
+        page_inches = max(float(page.mediabox.width), float(page.mediabox.height)) / 72.0
+        try:
+            images = list(page.images)
+        except Exception:
+            continue
+        for image in images:
+            try:
+                pil = image.image
+                if pil.mode in ("1", "RGBA", "LA", "PA") or page_inches <= 0:
+                    # bilevel scans are already compact; masks would be lost in JPEG
+                    continue
+                # an image's effective dpi as if it covered the page, an upper bound for smaller images
+                scale = _scale(pil.width, pil.height, max(pil.width, pil.height) / page_inches)
+                if scale >= 1.0:
+                    continue
+                pil = pil.resize((max(1, round(pil.width * scale)), max(1, round(pil.height * scale))), Image.LANCZOS)
+                image.replace(_flatten(pil), quality=PREPROCESS_JPEG_QUALITY)
+                if "downscaled" not in actions:
+                    actions.append("downscaled")
+            except Exception:
+                continue
+        page.compress_content_streams()
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+    try:
+        writer.metadata = None
+    except Exception:
+        pass
+    actions.append("recompressed")
+    dst = _tempfile(src, ".pdf")
+    with open(dst, "wb") as f:
+        writer.write(f)
+    return dst
+
+def optimize(path):
+    """
+    Optimize one file (runs in a pool process). Returns a report: path (the file to upload, the
+    original when nothing was gained), original_bytes, bytes, saved_bytes, seconds, actions and
+    error when optimization failed.
+    """
+    t0 = time.perf_counter()
+    original = os.path.getsize(path)
+    report = {"path": path, "original_bytes": original, "bytes": original, "saved_bytes": 0, "actions": []}
+    actions = []
+    dst = None
+    try:
+        if path.lower().endswith(".pdf"):
+            dst = optimize_pdf(path, actions)
+        else:
+            dst = optimize_image(path, actions)
+        if dst:
+            size = os.path.getsize(dst)
+            # a rotated image is used even if it grew: OCR needs it upright
+            if size < original or "rotated" in actions:
+                report.update(path=dst, bytes=size, saved_bytes=original - size, actions=actions)
+                dst = None
+    except Exception as e:
+        report["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if dst:
+            os.unlink(dst)
+    report["seconds"] = round(time.perf_counter() - t0, 4)
+    return report
+
+def _observe(report):
+    if report.get("error"):
+        log.warning("preprocessing %s failed, uploading it unchanged: %s", report["path"], report["error"])
+    PREPROCESS_SECONDS.observe(report["seconds"])
+    if report["saved_bytes"] > 0:
+        PREPROCESS_SAVED_BYTES.inc(report["saved_bytes"])
+
+def _failed(path, error, started):
+    # optimization is optional: the original file is uploaded unchanged
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = None
+    return {"path": path, "original_bytes": size, "bytes": size, "saved_bytes": 0, "actions": [],
+            "error": f"{type(error).__name__}: {error}", "seconds": round(time.perf_counter() - started, 4)}
+
+def prepare_upload(path):
+    """
+    Report for the file to upload instead of path (see optimize), or None when preprocessing is
+    off or doesn't apply. The caller deletes report["path"] when it differs from path. Never raises:
+    when the pool or the optimizer fails, the report points at the original file.
+    """
+    if not enabled_for(path):
+        return None
+    started = time.perf_counter()
+    try:
+        report = run(optimize, path)
+    except Exception as e:
+        report = _failed(path, e, started)
+    _observe(report)
+    return report
+
+async def prepare_upload_async(path):
+    if not enabled_for(path):
+        return None
+    started = time.perf_counter()
+    try:
+        report = await run_async(optimize, path)
+    except Exception as e:
+        report = _failed(path, e, started)
+    _observe(report)
+    return report
@@ -0,0 +1,75 @@
+# app/procpool.py
+"""
+Shared process pool for CPU-bound work (DOCX rendering, upload image optimization), so it runs
+outside the GIL of the API / worker process. Created lazily on first use; tasks only receive paths
+and job ids and read what they need from disk.
+
+A pool whose worker died (BrokenProcessPool) is replaced by a fresh one and the task retried once,
+so one crash doesn't break rendering and preprocessing until the process restarts.
+"""
+import os
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# EXPORT_WORKERS is the older name of this setting
+PROCESS_POOL_WORKERS = int(os.environ.get("PROCESS_POOL_WORKERS", os.environ.get("EXPORT_WORKERS", str(os.cpu_count() or 2))))
+
+_pool = None
+_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawn: forking a process that runs worker threads and SQLite connections is unsafe
+            _pool = ProcessPoolExecutor(max_workers=max(1, PROCESS_POOL_WORKERS), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def _discard(pool):
+    # only the broken pool: another thread may already have replaced it
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def submit(fn, *args):
+    """Submit fn(*args) to the shared pool, replacing the pool once if it is broken."""
+    pool = get_pool()
+    try:
+        return pool.submit(fn, *args)
+    except BrokenProcessPool:
+        _discard(pool)
+        return get_pool().submit(fn, *args)
+
+def run(fn, *args):
+    """fn(*args) in the pool, waiting for the result; retried once in a fresh pool if a worker died."""
+    for attempt in (1, 2):
+        pool = get_pool()
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            _discard(pool)
+            if attempt == 2:
+                raise
+
+async def run_async(fn, *args):
+    """Awaitable variant of run()."""
+    for attempt in (1, 2):
+        pool = get_pool()
+        try:
+            return await asyncio.wrap_future(pool.submit(fn, *args))
+        except BrokenProcessPool:
+            _discard(pool)
+            if attempt == 2:
+                raise
+
+def shutdown_pool():
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
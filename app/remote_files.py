@@ -0,0 +1,195 @@
+# app/remote_files.py
+"""
+Registry of files uploaded to Mistral, keyed by content hash. Each entry keeps the remote file_id
+and the current signed URL with its expiry, so a document is uploaded once and later calls (OCR,
+chat, QnA) only ask for a fresh signed URL when the old one is about to expire. Entries unused for
+REMOTE_FILE_TTL_DAYS are deleted remotely by gc_remote_files():
+
+    python -m app.remote_files gc
+"""
+import os
+import sys
+import time
+import argparse
+import asyncio
+from datetime import datetime
+
+from .utils import get_db_conn
+from .mistral_client import client, get_async_client
+from .gateway import call, acall
+
+# lifetime requested for signed URLs (hours) and how long before expiry they are renewed (seconds)
+SIGNED_URL_EXPIRY_HOURS = int(os.environ.get("SIGNED_URL_EXPIRY_HOURS", "24"))
+SIGNED_URL_REFRESH_MARGIN = int(os.environ.get("SIGNED_URL_REFRESH_MARGIN", "600"))
+# remote files not used for this long are deleted by gc_remote_files()
+REMOTE_FILE_TTL_DAYS = float(os.environ.get("REMOTE_FILE_TTL_DAYS", "7"))
+
+def get_remote_file(content_hash):
+    conn = get_db_conn()
+    try:
+        row = conn.execute("SELECT * FROM remote_files WHERE content_hash = ?", (content_hash,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+def _save(content_hash, file_id, file_name, signed_url):
+    now = time.time()
+    conn = get_db_conn()
+    with conn:
+        conn.execute("""
+        INSERT INTO remote_files(content_hash, file_id, file_name, signed_url, url_expires_at, uploaded_at, last_used_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(content_hash) DO UPDATE SET
+          file_id = excluded.file_id, file_name = excluded.file_name, signed_url = excluded.signed_url,
+          url_expires_at = excluded.url_expires_at, uploaded_at = excluded.uploaded_at, last_used_at = excluded.last_used_at
+        """, (content_hash, file_id, file_name, signed_url, now + SIGNED_URL_EXPIRY_HOURS * 3600, datetime.utcnow().isoformat(), now))
+    conn.close()
+
+def _refreshed(content_hash, signed_url):
+    now = time.time()
+    conn = get_db_conn()
+    with conn:
+        conn.execute("UPDATE remote_files SET signed_url = ?, url_expires_at = ?, last_used_at = ? WHERE content_hash = ?",
+                     (signed_url, now + SIGNED_URL_EXPIRY_HOURS * 3600, now, content_hash))
+    conn.close()
+
+def _touch(content_hash):
+    conn = get_db_conn()
+    with conn:
+        conn.execute("UPDATE remote_files SET last_used_at = ? WHERE content_hash = ?", (time.time(), content_hash))
+    conn.close()
+
+def _forget(content_hash):
+    conn = get_db_conn()
+    with conn:
+        conn.execute("DELETE FROM remote_files WHERE content_hash = ?", (content_hash,))
+    conn.close()
+
+def _url_fresh(entry):
+    return bool(entry and entry.get("signed_url") and (entry.get("url_expires_at") or 0) > time.time() + SIGNED_URL_REFRESH_MARGIN)
+
+def _upload(file_path, name):
+    # the file is opened per attempt so a retried upload sends the whole file again
+    with open(file_path, "rb") as fh:
+        return client.files.upload(file={"file_name": name, "content": fh}, purpose="ocr")
+
+async def _upload_async(aclient, file_path, name):
+    with open(file_path, "rb") as fh:
+        return await aclient.files.upload_async(file={"file_name": name, "content": fh}, purpose="ocr")
+
+def _prepared(file_path, report):
+    """Path and remote name to upload, given the report of a prepare hook (see app.preprocess)."""
+    name = os.path.basename(file_path)
+    if not report or report.get("path") in (None, file_path):
+        return file_path, name
+    # keep the original name, with the extension of the re-encoded file
+    return report["path"], os.path.splitext(name)[0] + os.path.splitext(report["path"])[1]
+
+def _discard(file_path, upload_path):
+    if upload_path != file_path:
+        try:
+            os.unlink(upload_path)
+        except OSError:
+            pass
+
+def signed_url_for(file_path, content_hash=None, prepare=None):
+    """
+    Signed URL for a local file: the registered URL while it is valid, a refreshed URL for the
+    already uploaded file_id, or a new upload when the file is unknown (or gone remotely).
+    prepare(file_path) is only called when an upload actually happens; it may return a report whose
+    "path" is an optimized temporary copy to upload instead (deleted afterwards).
+    """
+    entry = get_remote_file(content_hash) if content_hash else None
+    if _url_fresh(entry):
+        _touch(content_hash)
+        return entry["signed_url"]
+    if entry:
+        try:
+            url = call("files", client.files.get_signed_url, file_id=entry["file_id"], expiry=SIGNED_URL_EXPIRY_HOURS).url
+            _refreshed(content_hash, url)
+            return url
+        except Exception:
+            # deleted or expired on the remote side: upload again
+            _forget(content_hash)
+    if not file_path or not os.path.exists(file_path):
+        raise FileNotFoundError(f"original file not available for upload: {file_path}")
+    upload_path, name = _prepared(file_path, prepare(file_path) if prepare else None)
+    try:
+        up = call("files", _upload, upload_path, name)
+    finally:
+        _discard(file_path, upload_path)
+    url = call("files", client.files.get_signed_url, file_id=up.id, expiry=SIGNED_URL_EXPIRY_HOURS).url
+    if content_hash:
+        _save(content_hash, up.id, name, url)
+    return url
+
+async def signed_url_for_async(file_path, content_hash=None, prepare=None):
+    """
+    Async variant of signed_url_for over the pooled async client; SQLite work runs in threads and
+    prepare is awaited.
+    """
+    aclient = get_async_client()
+    entry = await asyncio.to_thread(get_remote_file, content_hash) if content_hash else None
+    if _url_fresh(entry):
+        await asyncio.to_thread(_touch, content_hash)
+        return entry["signed_url"]
+    if entry:
+        try:
+            url = (await acall("files", aclient.files.get_signed_url_async, file_id=entry["file_id"], expiry=SIGNED_URL_EXPIRY_HOURS)).url
+            await asyncio.to_thread(_refreshed, content_hash, url)
+            return url
+        except Exception:
+            await asyncio.to_thread(_forget, content_hash)
+    if not file_path or not os.path.exists(file_path):
+        raise FileNotFoundError(f"original file not available for upload: {file_path}")
+    upload_path, name = _prepared(file_path, await prepare(file_path) if prepare else None)
+    try:
+        up = await acall("files", _upload_async, aclient, upload_path, name)
+    finally:
+        await asyncio.to_thread(_discard, file_path, upload_path)
+    url = (await acall("files", aclient.files.get_signed_url_async, file_id=up.id, expiry=SIGNED_URL_EXPIRY_HOURS)).url
+    if content_hash:
+        await asyncio.to_thread(_save, content_hash, up.id, name, url)
+    return url
+
+def gc_remote_files(max_age_days=None):
+    """
+    Delete remote files not used for max_age_days (REMOTE_FILE_TTL_DAYS) and drop their entries.
+    Returns the number of files removed.
+    """
+    max_age_days = REMOTE_FILE_TTL_DAYS if max_age_days is None else max_age_days
+    cutoff = time.time() - max_age_days * 86400
+    conn = get_db_conn()
+    try:
+        rows = conn.execute("SELECT content_hash, file_id FROM remote_files WHERE last_used_at < ?", (cutoff,)).fetchall()
+    finally:
+        conn.close()
+    removed = 0
+    for row in rows:
+        try:
+            call("files", client.files.delete, file_id=row["file_id"])
+        except Exception as e:
+            # already gone remotely is fine; anything else is retried on the next run
+            if getattr(e, "status_code", None) != 404:
+                continue
+        conn = get_db_conn()
+        with conn:
+            # only if it wasn't used again meanwhile
+            conn.execute("DELETE FROM remote_files WHERE content_hash = ? AND file_id = ? AND last_used_at < ?", (row["content_hash"], row["file_id"], cutoff))
+        conn.close()
+        removed += 1
+    return removed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Remote (Mistral Files) upload registry maintenance")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    g = sub.add_parser("gc", help="delete remote files not used for REMOTE_FILE_TTL_DAYS")
+    g.add_argument("--max-age-days", type=float, default=None)
+    args = parser.parse_args(argv)
+    if args.cmd == "gc":
+        from .utils import init_db
+        init_db()
+        print(f"deleted {gc_remote_files(args.max_age_days)} remote file(s)")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
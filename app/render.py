@@ -0,0 +1,266 @@
+# app/render.py
+"""
+Document rendering for downloads and exports. Markdown is converted to Word with real styles
+(Title / Heading n, List Bullet / List Number, Table Grid tables, Quote, inline bold / italic /
+strike / code). Rendered files are cached next to the job's artifacts as
+data/results/<job_id>/document-<key>.docx, where key hashes the renderer version, the title and the
+markdown, so repeat downloads are plain file responses and any change to the result renders anew.
+
+Functions here only read artifacts from disk, so they can run in threads or in a process pool
+(see app.procpool); with DOCX_PRERENDER=1 finished jobs are rendered in the background right away.
+"""
+import os
+import re
+import hashlib
+
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+from .artifacts import artifact_dir, read_meta, read_markdown
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+# bump when the output of render_docx changes, so cached files are rendered again
+RENDER_VERSION = "3"
+DOCX_PRERENDER = os.environ.get("DOCX_PRERENDER", "0").lower() in ("1", "true", "yes")
+
+CODE_FONT = "Courier New"
+
+def document_markdown(meta, markdown):
+    """
+    Markdown to export for a result: the OCR markdown, else the QnA summary with the title.
+    """
+    markdown = markdown or meta.get("qna_summary") or None
+    if not markdown:
+        markdown = (meta.get("title") or "") + "\n\n" + (meta.get("qna_summary") or "")
+    return markdown
+
+# --- markdown -> docx -------------------------------------------------------
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_RULE = re.compile(r"^\s{0,3}([-*_])(\s*\1){2,}\s*$")
+_FENCE = re.compile(r"^\s{0,3}(`{3,}|~{3,})")
+_ITEM = re.compile(r"^(\s*)([-*+]|\d{1,9}[.)])\s+(.*)$")
+_QUOTE = re.compile(r"^\s{0,3}>\s?(.*)$")
+_TABLE_SEP = re.compile(r"^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$")
+_IMAGE_LINE = re.compile(r"^\s*(!\[[^\]]*\]\([^)]*\)\s*)+$")
+_BR = re.compile(r"<br\s*/?>", re.I)
+
+_INLINE = re.compile(
+    r"(?P<code>`+)(?P<code_text>.+?)(?P=code)"
+    r"|\*\*\*(?P<bi>.+?)\*\*\*"
+    r"|\*\*(?P<b1>.+?)\*\*|__(?P<b2>.+?)__"
+    # emphasis never crosses another delimiter; code spans inside it are kept whole
+    r"|\*(?P<i1>(?![\s*])(?:`[^`]*`|[^*`])+?)(?<!\s)\*"
+    r"|(?<![\w])_(?P<i2>(?![\s_])(?:`[^`]*`|[^_`])+?)(?<!\s)_(?![\w])"
+    r"|~~(?P<s>.+?)~~"
+    r"|!\[(?P<alt>[^\]]*)\]\([^)]*\)"
+    r"|\[(?P<link>[^\]]+)\]\([^)]*\)"
+)
+# backslash escapes are swapped for private-use characters while inline markup is parsed
+_ESCAPABLE = re.compile(r"\\([\\`*_{}\[\]()#+\-.!|~>])")
+_ESCAPED = re.compile("[\ue000-\ue07f]")
+
+def _protect(text):
+    return _ESCAPABLE.sub(lambda m: chr(0xE000 + ord(m.group(1))), text)
+
+def _restore(text):
+    return _ESCAPED.sub(lambda m: chr(ord(m.group(0)) - 0xE000), text)
+
+def _run(paragraph, text, bold=False, italic=False, strike=False, code=False):
+    if not text:
+        return
+    run = paragraph.add_run(_restore(_BR.sub("\n", text)))
+    run.bold = bold or None
+    run.italic = italic or None
+    if strike:
+        run.font.strike = True
+    if code:
+        run.font.name = CODE_FONT
+
+def _inline(paragraph, text, bold=False, italic=False, strike=False):
+    pos = 0
+    for m in _INLINE.finditer(text):
+        _run(paragraph, text[pos:m.start()], bold, italic, strike)
+        pos = m.end()
+        if m.group("code"):
+            _run(paragraph, m.group("code_text").strip(), bold, italic, strike, code=True)
+        elif m.group("bi") is not None:
+            _inline(paragraph, m.group("bi"), True, True, strike)
+        elif m.group("b1") is not None or m.group("b2") is not None:
+            _inline(paragraph, m.group("b1") or m.group("b2"), True, italic, strike)
+        elif m.group("i1") is not None or m.group("i2") is not None:
+            _inline(paragraph, m.group("i1") or m.group("i2"), bold, True, strike)
+        elif m.group("s") is not None:
+            _inline(paragraph, m.group("s"), bold, italic, True)
+        elif m.group("link") is not None:
+            _inline(paragraph, m.group("link"), bold, italic, strike)
+        # images (OCR placeholders such as ![img-0.jpeg](img-0.jpeg)) are dropped
+    _run(paragraph, text[pos:], bold, italic, strike)
+
+def _style(document, name, fallback="Normal"):
+    try:
+        return document.styles[name]
+    except KeyError:
+        return document.styles[fallback]
+
+def _cells(line):
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|"):
+        line = line[:-1]
+    return [c.strip() for c in line.split("|")]
+
+def _alignments(sep_line):
+    out = []
+    for c in _cells(sep_line):
+        if c.startswith(":") and c.endswith(":"):
+            out.append(WD_ALIGN_PARAGRAPH.CENTER)
+        elif c.endswith(":"):
+            out.append(WD_ALIGN_PARAGRAPH.RIGHT)
+        else:
+            out.append(None)
+    return out
+
+def _table(document, rows, aligns):
+    ncols = max(len(r) for r in rows)
+    table = document.add_table(rows=len(rows), cols=ncols)
+    table.style = _style(document, "Table Grid")
+    for i, row in enumerate(rows):
+        cells = table.rows[i].cells
+        for j in range(ncols):
+            p = cells[j].paragraphs[0]
+            if j < len(aligns) and aligns[j] is not None:
+                p.alignment = aligns[j]
+            _inline(p, row[j] if j < len(row) else "", bold=(i == 0))
+
+def _is_block_start(lines, i):
+    line = lines[i]
+    return bool(_HEADING.match(line) or _RULE.match(line) or _FENCE.match(line) or _ITEM.match(line) or _QUOTE.match(line)
+                or ("|" in line and i + 1 < len(lines) and _TABLE_SEP.match(lines[i + 1]) and "|" in lines[i + 1]))
+
+def render_docx(title, markdown):
+    """Build a python-docx Document from a title and markdown (CommonMark / GFM subset)."""
+    document = Document()
+    if title:
+        document.add_heading(title, level=0)
+    lines = _protect(markdown.replace("\r\n", "\n").replace("\t", "    ")).split("\n")
+    i, n = 0, len(lines)
+    while i < n:
+        line = lines[i]
+        if not line.strip() or _IMAGE_LINE.match(line):
+            i += 1
+            continue
+        fence = _FENCE.match(line)
+        if fence:
+            # code block: one paragraph, monospace, line breaks kept
+            marker, body = fence.group(1), []
+            i += 1
+            while i < n and not lines[i].strip().startswith(marker):
+                body.append(_restore(lines[i]))
+                i += 1
+            i += 1
+            p = document.add_paragraph(style=_style(document, "No Spacing"))
+            run = p.add_run("\n".join(body))
+            run.font.name = CODE_FONT
+            continue
+        m = _HEADING.match(line)
+        if m:
+            _inline(document.add_heading("", level=len(m.group(1))), m.group(2))
+            i += 1
+            continue
+        if _RULE.match(line):
+            document.add_paragraph()
+            i += 1
+            continue
+        if "|" in line and i + 1 < n and _TABLE_SEP.match(lines[i + 1]) and "|" in lines[i + 1]:
+            rows, aligns = [_cells(line)], _alignments(lines[i + 1])
+            i += 2
+            while i < n and lines[i].strip() and "|" in lines[i]:
+                rows.append(_cells(lines[i]))
+                i += 1
+            _table(document, rows, aligns)
+            continue
+        m = _ITEM.match(line)
+        if m:
+            level = min(len(m.group(1)) // 2, 2)
+            kind = "List Number" if m.group(2)[0].isdigit() else "List Bullet"
+            text = m.group(3)
+            i += 1
+            # lazy continuation lines belong to the item
+            while i < n and lines[i].strip() and not _is_block_start(lines, i):
+                text += " " + lines[i].strip()
+                i += 1
+            _inline(document.add_paragraph(style=_style(document, kind if level == 0 else f"{kind} {level + 1}", kind)), text)
+            continue
+        m = _QUOTE.match(line)
+        if m:
+            text = []
+            while i < n and _QUOTE.match(lines[i]):
+                text.append(_QUOTE.match(lines[i]).group(1).strip())
+                i += 1
+            _inline(document.add_paragraph(style=_style(document, "Quote")), " ".join(t for t in text if t))
+            continue
+        # paragraph: consecutive plain lines are one paragraph (soft line breaks)
+        text = [line.strip()]
+        i += 1
+        while i < n and lines[i].strip() and not _is_block_start(lines, i):
+            text.append(lines[i].strip())
+            i += 1
+        _inline(document.add_paragraph(), " ".join(text))
+    return document
+
+# --- cached artifacts -------------------------------------------------------
+
+def render_key(title, markdown):
+    h = hashlib.sha256()
+    h.update(RENDER_VERSION.encode())
+    h.update(b"\0" + (title or "").encode("utf-8") + b"\0")
+    h.update(markdown.encode("utf-8"))
+    return h.hexdigest()
+
+def cached_docx(job_id, render=True):
+    """
+    Path of the job's rendered .docx, rendering it first when it isn't cached yet (or returning
+    None when render is False). None if the job has no result.
+    """
+    meta = read_meta(job_id)
+    if meta is None or meta.get("status") == "failed":
+        return None
+    title = meta.get("title") or ""
+    markdown = document_markdown(meta, read_markdown(job_id))
+    d = artifact_dir(job_id)
+    path = d / f"document-{render_key(title, markdown)[:16]}.docx"
+    if path.exists():
+        return str(path)
+    if not render:
+        return None
+    # unique temp name: concurrent renders of the same job must not write the same file
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{id(markdown)}.tmp")
+    render_docx(title, markdown).save(str(tmp))
+    os.replace(tmp, path)
+    # renders of an older title / markdown / renderer version are stale now
+    for old in d.glob("document-*.docx"):
+        if old != path:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+    return str(path)
+
+def _swallow(future):
+    if not future.cancelled():
+        future.exception()
+
+def prerender_docx(job_id):
+    """
+    Queue a background render of a finished job (DOCX_PRERENDER) in the shared process pool, so
+    the first download is already a file response. Best-effort; never raises.
+    """
+    if not DOCX_PRERENDER:
+        return
+    try:
+        from .procpool import submit
+        submit(cached_docx, job_id).add_done_callback(_swallow)
+    except Exception:
+        pass
@@ -0,0 +1,180 @@
+# app/retrieval.py
+"""
+Local retrieval for QnA. A document's markdown is split into overlapping chunks and indexed with
+BM25 once after OCR (artifact retrieval.json.gz); questions then only send the top-k chunks to the
+chat model instead of the whole document.
+"""
+import os
+import re
+import gzip
+import json
+import math
+import threading
+from collections import Counter, OrderedDict
+
+from .artifacts import artifact_dir, artifact_path, read_markdown
+
+RETRIEVAL = "retrieval.json.gz"
+INDEX_VERSION = 1
+
+# "chunks" (top-k retrieved chunks) or "document" (send the whole document URL, previous behaviour)
+QNA_MODE = os.environ.get("QNA_MODE", "chunks")
+QNA_TOP_K = int(os.environ.get("QNA_TOP_K", "5"))
+# largest top_k a request may ask for; more chunks than this is what document mode is for
+QNA_MAX_TOP_K = int(os.environ.get("QNA_MAX_TOP_K", "20"))
+QNA_CHUNK_WORDS = int(os.environ.get("QNA_CHUNK_WORDS", "200"))
+QNA_CHUNK_OVERLAP = int(os.environ.get("QNA_CHUNK_OVERLAP", "40"))
+# loaded indexes kept in memory
+QNA_INDEX_CACHE = int(os.environ.get("QNA_INDEX_CACHE", "64"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have how in is it its of on or that the this to was were what
+when where which who why will with does do did can could should would not no yes
+""".split())
+
+_loaded = OrderedDict()
+_loaded_lock = threading.Lock()
+
+def tokenize(text):
+    return [w for w in _WORD.findall((text or "").lower()) if w not in _STOPWORDS and (len(w) > 1 or w.isdigit())]
+
+def chunk_markdown(markdown, max_words=None, overlap=None):
+    """
+    Split markdown into chunks of about max_words words on paragraph boundaries. Consecutive
+    chunks share up to `overlap` trailing words so an answer spanning a boundary stays retrievable.
+    """
+    max_words = max_words or QNA_CHUNK_WORDS
+    overlap = QNA_CHUNK_OVERLAP if overlap is None else overlap
+    blocks = []
+    for block in re.split(r"\n\s*\n", markdown or ""):
+        words = block.split()
+        if not words:
+            continue
+        if len(words) <= max_words:
+            blocks.append(block.strip())
+            continue
+        # oversized paragraph or table: hard split on words
+        for start in range(0, len(words), max_words):
+            blocks.append(" ".join(words[start:start + max_words]))
+
+    chunks, current, size = [], [], 0
+    for block in blocks:
+        n = len(block.split())
+        if current and size + n > max_words:
+            chunks.append("\n\n".join(current))
+            tail = " ".join(chunks[-1].split()[-overlap:]) if overlap > 0 else ""
+            current, size = ([tail], len(tail.split())) if tail else ([], 0)
+        current.append(block)
+        size += n
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def build_index(markdown):
+    """
+    BM25 index of a document: chunks plus an inverted index term -> [[chunk_no, tf], ...].
+    """
+    chunks = chunk_markdown(markdown)
+    postings = {}
+    lengths = []
+    for i, chunk in enumerate(chunks):
+        tokens = tokenize(chunk)
+        lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            postings.setdefault(term, []).append([i, tf])
+    return {
+        "version": INDEX_VERSION,
+        "chunks": chunks,
+        "lengths": lengths,
+        "avgdl": (sum(lengths) / len(lengths)) if lengths else 0.0,
+        "postings": postings,
+    }
+
+def write_index(job_id, index):
+    d = artifact_dir(job_id)
+    d.mkdir(parents=True, exist_ok=True)
+    path = artifact_path(job_id, RETRIEVAL)
+    tmp = path.with_name(path.name + ".tmp")
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+    with _loaded_lock:
+        _loaded.pop(job_id, None)
+
+def index_document(job_id, markdown):
+    index = build_index(markdown)
+    write_index(job_id, index)
+    return index
+
+def load_index(job_id):
+    """
+    The job's BM25 index; built from document.md and persisted if it doesn't exist yet (older
+    jobs, cache hits). None when the job has no markdown.
+    """
+    path = artifact_path(job_id, RETRIEVAL)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    with _loaded_lock:
+        entry = _loaded.get(job_id)
+        if entry and entry[0] == mtime:
+            _loaded.move_to_end(job_id)
+            return entry[1]
+    index = None
+    if mtime is not None:
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                index = json.load(f)
+        except Exception:
+            index = None
+    if index is None or index.get("version") != INDEX_VERSION:
+        markdown = read_markdown(job_id)
+        if not markdown:
+            return None
+        index = index_document(job_id, markdown)
+        mtime = os.path.getmtime(path)
+    with _loaded_lock:
+        _loaded[job_id] = (mtime, index)
+        while len(_loaded) > QNA_INDEX_CACHE:
+            _loaded.popitem(last=False)
+    return index
+
+def clamp_top_k(k):
+    """Effective chunk count for a requested k: QNA_TOP_K when unset or not positive, at most QNA_MAX_TOP_K."""
+    k = k if isinstance(k, int) and k > 0 else QNA_TOP_K
+    return max(1, min(k, QNA_MAX_TOP_K))
+
+def top_chunks(index, question, k=None):
+    """
+    [{"chunk", "score", "text"}] of the k best chunks for question, best first.
+    """
+    k = clamp_top_k(k)
+    n = len(index["chunks"])
+    if not n:
+        return []
+    avgdl = index["avgdl"] or 1.0
+    lengths = index["lengths"]
+    scores = {}
+    for term in set(tokenize(question)):
+        plist = index["postings"].get(term)
+        if not plist:
+            continue
+        idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+        for i, tf in plist:
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * lengths[i] / avgdl)
+            scores[i] = scores.get(i, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+    best = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+    return [{"chunk": i, "score": round(s, 4), "text": index["chunks"][i]} for i, s in best]
+
+def qna_messages(question, hits):
+    # excerpts in document order read better than score order
+    excerpts = "\n\n".join(f"[{h['chunk']}]\n{h['text']}" for h in sorted(hits, key=lambda h: h["chunk"]))
+    return [
+        {"role": "system", "content": "Answer the question using only the document excerpts provided. If they do not contain the answer, say so."},
+        {"role": "user", "content": f"Document excerpts:\n\n{excerpts}\n\nQuestion: {question}"},
+    ]
@@ -0,0 +1,111 @@
+# app/search.py
+"""
+Full-text search over completed documents. Titles and full markdown are indexed in the
+`documents_fts` FTS5 table of jobs.db when a job completes; existing results are indexed with
+
+    python -m app.search reindex [--all]
+"""
+import re
+import sys
+import argparse
+from datetime import datetime
+
+from .utils import get_db_conn
+
+SNIPPET_TOKENS = 24
+
+_TOKEN = re.compile(r"\w+\*?", re.UNICODE)
+
+def index_document(job_id, title, markdown):
+    """
+    (Re)index one document. Safe to call again for the same job.
+    """
+    conn = get_db_conn()
+    with conn:
+        now = datetime.utcnow().isoformat()
+        conn.execute("INSERT INTO search_docs(job_id, indexed_at) VALUES (?, ?) ON CONFLICT(job_id) DO UPDATE SET indexed_at = excluded.indexed_at", (job_id, now))
+        doc_id = conn.execute("SELECT id FROM search_docs WHERE job_id = ?", (job_id,)).fetchone()["id"]
+        conn.execute("DELETE FROM documents_fts WHERE rowid = ?", (doc_id,))
+        conn.execute("INSERT INTO documents_fts(rowid, title, body) VALUES (?, ?, ?)", (doc_id, title or "", markdown or ""))
+    conn.close()
+
+def fts_query(text):
+    """
+    Turn free text into a safe FTS5 query: every word becomes a quoted term (all must match),
+    a trailing * keeps prefix matching. FTS5 operators in user input are not interpreted.
+    """
+    terms = []
+    for tok in _TOKEN.findall(text or ""):
+        prefix = tok.endswith("*")
+        word = tok.rstrip("*")
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+def search(query, limit=20, offset=0):
+    """
+    Ranked matches for query: [{"job_id", "title", "filename", "created_at", "snippet", "score"}].
+    Titles weigh more than body text; snippets mark matches with <mark>...</mark>.
+    """
+    match = fts_query(query)
+    if not match:
+        return []
+    conn = get_db_conn()
+    try:
+        rows = conn.execute(f"""
+        SELECT d.job_id, j.title, j.filename, j.created_at,
+               snippet(documents_fts, 1, '<mark>', '</mark>', '…', {SNIPPET_TOKENS}) AS snippet,
+               bm25(documents_fts, 5.0, 1.0) AS score
+        FROM documents_fts f
+        JOIN search_docs d ON d.id = f.rowid
+        LEFT JOIN jobs j ON j.job_id = d.job_id
+        WHERE documents_fts MATCH ?
+        ORDER BY score
+        LIMIT ? OFFSET ?
+        """, (match, limit, offset)).fetchall()
+    finally:
+        conn.close()
+    # bm25() is lower-is-better; report a positive score
+    return [dict(r, score=round(-r["score"], 4)) for r in rows]
+
+def reindex(all_jobs=False):
+    """
+    Index completed jobs that are missing from the index (every completed job with all_jobs=True).
+    Returns the number of documents indexed.
+    """
+    from .artifacts import read_markdown
+    conn = get_db_conn()
+    try:
+        sql = "SELECT job_id, title FROM jobs WHERE status = 'completed'"
+        if not all_jobs:
+            sql += " AND job_id NOT IN (SELECT job_id FROM search_docs)"
+        rows = conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+    indexed = 0
+    for row in rows:
+        markdown = read_markdown(row["job_id"])
+        if markdown is None and not row["title"]:
+            continue
+        index_document(row["job_id"], row["title"], markdown)
+        indexed += 1
+    return indexed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Full-text search index maintenance")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("reindex", help="index completed jobs that are not in the search index yet")
+    r.add_argument("--all", action="store_true", help="rebuild the entries of every completed job")
+    args = parser.parse_args(argv)
+    if args.cmd == "reindex":
+        from .utils import init_db
+        init_db()
+        n = reindex(all_jobs=args.all)
+        conn = get_db_conn()
+        with conn:
+            conn.execute("INSERT INTO documents_fts(documents_fts) VALUES ('optimize')")
+        conn.close()
+        print(f"indexed {n} document(s)")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,105 @@
+# app/sharding.py
+import os
+import re
+
+from .artifacts import artifact_dir
+
+# pages per OCR call for large PDFs (0 disables sharding)
+OCR_SHARD_PAGES = int(os.environ.get("OCR_SHARD_PAGES", "20"))
+# only shard documents with at least this many pages
+OCR_SHARD_MIN_PAGES = int(os.environ.get("OCR_SHARD_MIN_PAGES", "40"))
+# shards OCR'd at the same time for one document
+OCR_SHARD_CONCURRENCY = int(os.environ.get("OCR_SHARD_CONCURRENCY", "4"))
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # optional: fall back to a raw scan of the file
+    PdfReader = None
+
+def count_pdf_pages(file_path):
+    """
+    Best-effort page count of a local PDF, None if it isn't a PDF or can't be read.
+    """
+    if not file_path or not os.path.exists(file_path):
+        return None
+    try:
+        with open(file_path, "rb") as f:
+            if f.read(5) != b"%PDF-":
+                return None
+    except OSError:
+        return None
+    if PdfReader is not None:
+        try:
+            return len(PdfReader(file_path).pages)
+        except Exception:
+            pass
+    # without pypdf: count page objects; misses pages hidden in compressed object streams
+    try:
+        with open(file_path, "rb") as f:
+            data = f.read()
+        n = len(re.findall(rb"/Type\s*/Page(?![a-zA-Z])", data))
+        return n or None
+    except Exception:
+        return None
+
+def plan_shards(total_pages, shard_pages=None, force=False):
+    """
+    Split [0, total_pages) into page-index lists, or return None when the document should go
+    through a single OCR call.
+    """
+    shard_pages = shard_pages or OCR_SHARD_PAGES
+    if not total_pages or shard_pages <= 0:
+        return None
+    if not force and total_pages < max(OCR_SHARD_MIN_PAGES, shard_pages + 1):
+        return None
+    return [list(range(start, min(start + shard_pages, total_pages))) for start in range(0, total_pages, shard_pages)]
+
+def pages_dir(job_id):
+    return artifact_dir(job_id) / "pages"
+
+def page_path(job_id, index):
+    return pages_dir(job_id) / f"{int(index):05d}.md"
+
+def write_page(job_id, index, markdown):
+    d = pages_dir(job_id)
+    d.mkdir(parents=True, exist_ok=True)
+    tmp = page_path(job_id, index).with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(markdown or "")
+    os.replace(tmp, page_path(job_id, index))
+
+def read_pages(job_id, since=0):
+    """
+    Return [{"index", "markdown"}] for the pages persisted so far with index >= since, in page order.
+    """
+    d = pages_dir(job_id)
+    if not d.exists():
+        return []
+    pages = []
+    for name in sorted(os.listdir(d)):
+        if not name.endswith(".md"):
+            continue
+        index = int(name[:-3])
+        if index < since:
+            continue
+        with open(d / name, "r", encoding="utf-8") as f:
+            pages.append({"index": index, "markdown": f.read()})
+    return pages
+
+def page_items(ocr_resp):
+    """
+    (index, markdown, page_dict) for each page of an OCR response.
+    """
+    pages = getattr(ocr_resp, "pages", None)
+    if pages is None and isinstance(ocr_resp, dict):
+        pages = ocr_resp.get("pages")
+    items = []
+    for p in pages or []:
+        if isinstance(p, dict):
+            d = p
+        elif hasattr(p, "model_dump"):
+            d = p.model_dump()
+        else:
+            d = {"index": getattr(p, "index", None), "markdown": getattr(p, "markdown", None)}
+        items.append((d.get("index"), d.get("markdown") or "", d))
+    return items
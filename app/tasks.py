@@ -2,8 +2,26 @@
 import os
 import json
 import re
-from .mistral_client import client, DocumentURLChunk
-from .utils import result_path, update_job_completed, update_job_title
+import time
+import asyncio
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .mistral_client import client, get_async_client, DocumentURLChunk
+from .utils import update_job_completed, update_job_progress
+from .cache import result_cache_key, lookup_result, store_result, CACHEABLE_FIELDS
+from .events import emit, emit_status
+from .artifacts import write_result, write_failure
+from .search import index_document
+from . import retrieval
+from .remote_files import signed_url_for, signed_url_for_async
+from .gateway import call, acall
+from .batches import child_finished
+from .render import prerender_docx
+from .preprocess import prepare_upload, prepare_upload_async
+from .metrics import span, JOB_SECONDS, JOBS_FINISHED, PAGES
+from .pipeline import stage, JobContext, run_stages, run_stages_async
+from .sharding import count_pdf_pages, plan_shards, page_items, write_page, OCR_SHARD_CONCURRENCY
 
 def _extract_markdown_from_ocr(ocr_resp):
     # Try object attributes first
@@ -61,110 +79,389 @@ def _extract_title_from_markdown(markdown_text):
     s = markdown_text.strip()
     return s[:120] if s else None
 
-def process_document(file_path: str = None, document_url: str = None, job_id: str = None, do_annotations: bool = False, annotation_schema: dict = None, do_qna: bool = False):
-    result = {"job_id": job_id, "steps": []}
-    signed_url = None
-    pages_processed = None
-    title_generated = None
+OCR_MODEL = "mistral-ocr-latest"
+# one OCR call carrying the annotation format instead of two, and one JSON chat call for title + summary
+PIPELINE_CONSOLIDATED = os.environ.get("PIPELINE_CONSOLIDATED", "0").lower() in ("1", "true", "yes")
 
+def _qna_model():
+    return os.environ.get("DOC_QNA_MODEL", "mistral-small-latest")
+
+def _title_messages(signed_url):
+    return [
+        {"role":"user", "content":[{"type":"text", "text":"Create a short descriptive title (max 8 words) for the following document. Return only the title as plain text."}, {"type":"document_url","document_url": signed_url}]}
+    ]
+
+def _summary_messages(signed_url):
+    return [
+        {"role":"user", "content":[{"type":"text","text":"Provide a short summary of the document."}, {"type":"document_url","document_url":signed_url}]}
+    ]
+
+def _title_summary_messages(signed_url):
+    return [
+        {"role":"user", "content":[{"type":"text","text":"Read the document and answer with a JSON object with two keys: \"title\", a short descriptive title (max 8 words), and \"summary\", a short summary of the document."}, {"type":"document_url","document_url":signed_url}]}
+    ]
+
+def _title_from_chat(chat_resp):
+    try:
+        title = chat_resp.choices[0].message.content
+    except Exception:
+        title = str(chat_resp)
+    if isinstance(title, (list, dict)):
+        title = str(title)
+    if title:
+        # keep short
+        title = title.strip().strip('"').strip("'")[:120]
+    return title or None
+
+def _title_summary_from_chat(chat_resp):
+    """
+    (title, summary, error) from a JSON chat answer. Whatever parses is kept: a missing title is
+    None (the markdown heading is used), an answer that isn't JSON becomes the summary as it is.
+    """
+    content = chat_resp.choices[0].message.content
+    if isinstance(content, list):
+        content = "".join(getattr(c, "text", None) or (c.get("text") if isinstance(c, dict) else "") or "" for c in content)
+    # tolerate a ```json fence around the object
+    content = re.sub(r"^\s*```(?:json)?\s*|\s*```\s*$", "", content or "").strip()
+    try:
+        data = json.loads(content)
+    except ValueError as e:
+        return None, content or None, f"chat answer is not JSON: {e}"
+    if not isinstance(data, dict):
+        return None, content or None, "chat answer is not a JSON object"
+    title = data.get("title")
+    title = str(title).strip().strip('"').strip("'")[:120] if title else None
+    summary = data.get("summary")
+    return title or None, str(summary) if summary else None, None if summary else "chat answer has no summary"
+
+def _apply_title_summary(ctx, chat_resp):
+    ctx.model_title, summary, error = _title_summary_from_chat(chat_resp)
+    if summary:
+        ctx.result["qna_summary"] = summary
+    if error:
+        # partial answer: the stage still completes, the problem is recorded like an optional stage failure
+        ctx.result["steps"].append("title_summary_partial")
+        ctx.result.setdefault("errors", {})["title_summary"] = error
+
+def _pages_from_ocr(ocr_resp):
     try:
-        # upload local file to Mistral Files to get signed URL
-        if file_path:
-            up = client.files.upload(file={"file_name": os.path.basename(file_path), "content": open(file_path, "rb")}, purpose="ocr")
-            signed_obj = client.files.get_signed_url(file_id=up.id)
-            signed_url = signed_obj.url
-        elif document_url:
-            signed_url = document_url
-
-        # store document_url
-        result["document_url"] = signed_url
-
-        # OCR
-        ocr_resp = client.ocr.process(model="mistral-ocr-latest", document=DocumentURLChunk(document_url=signed_url), include_image_base64=False)
-        result["ocr"] = ocr_resp
-        result["steps"].append("ocr_done")
-
-        # pages info
+        if hasattr(ocr_resp, "usage_info") and getattr(ocr_resp.usage_info, "pages_processed", None):
+            return ocr_resp.usage_info.pages_processed
+    except Exception:
+        pass
+    return None
+
+def _annotation_format(annotation_schema):
+    return {"type":"json_schema", "json_schema": annotation_schema}
+
+def _annotate_in_ocr(ctx):
+    return PIPELINE_CONSOLIDATED and ctx.do_annotations and ctx.annotation_schema
+
+def _ocr_options(ctx):
+    # consolidated mode: the annotation format rides along with the primary OCR call
+    options = {"include_image_base64": False}
+    if _annotate_in_ocr(ctx):
+        options["bbox_annotation_format"] = _annotation_format(ctx.annotation_schema)
+    return options
+
+def _ocr_annotations(ctx, ocr_resp):
+    if _annotate_in_ocr(ctx):
+        ctx.result["annotations"] = ocr_resp
+        ctx.result["steps"].append("annotations_done")
+
+def _apply_ocr(result, ocr_resp):
+    result["ocr"] = ocr_resp
+    # Try to extract markdown
+    full_markdown = _extract_markdown_from_ocr(ocr_resp)
+    if full_markdown:
+        result["full_markdown"] = full_markdown
+    return full_markdown
+
+def _apply_title(result, title_generated, full_markdown):
+    # If no title from model, try extract from markdown
+    if not title_generated and full_markdown:
+        title_generated = _extract_title_from_markdown(full_markdown)
+    if title_generated:
+        result["title"] = title_generated
+    return title_generated
+
+def _finish_timings(timings, started, status, pages=None):
+    """Close a job's timings (total seconds) and record the job metrics; returns the jobs.extra patch."""
+    if timings is None:
+        return None
+    total = time.perf_counter() - started
+    timings["total"] = round(total, 4)
+    JOB_SECONDS.observe(total, status=status)
+    JOBS_FINISHED.inc(status=status)
+    if pages:
+        PAGES.inc(pages)
+    return {"timings": timings}
+
+def _save_completed(job_id, result, pages_processed, title_generated, cache_key, content_hash, timings=None, started=None):
+    # Save result artifacts (markdown, compressed OCR payload, metadata)
+    with span("job.save", timings):
+        rpath = write_result(job_id, result)
+
+    # one write: status, result path, pages, title (if extracted or generated) and timings
+    extra = _finish_timings(timings, started, "completed", pages_processed)
+    if extra is not None and result.get("preprocess"):
+        extra["preprocess"] = result["preprocess"]
+    update_job_completed(job_id, rpath, status="completed", pages=pages_processed, title=title_generated, extra=extra)
+    emit_status(job_id, "completed", title=title_generated, pages=pages_processed)
+    child_finished(job_id)
+    _index_for_search(job_id, title_generated, result.get("full_markdown"))
+    prerender_docx(job_id)
+
+    # remember the result for future uploads of the same content (best-effort);
+    # results with a failed optional stage are not worth replaying
+    if not result.get("errors"):
         try:
-            if hasattr(ocr_resp, "usage_info") and getattr(ocr_resp.usage_info, "pages_processed", None):
-                pages_processed = ocr_resp.usage_info.pages_processed
+            store_result(cache_key, content_hash, result, pages=pages_processed)
         except Exception:
-            pages_processed = None
+            pass
+
+    return {"status":"completed", "job_id": job_id}
+
+def _index_for_search(job_id, title, markdown):
+    # best-effort: `python -m app.search reindex` picks up anything missed here
+    try:
+        index_document(job_id, title, markdown)
+    except Exception:
+        pass
+
+def _save_failed(job_id, error, pages_processed, title_generated, timings=None, started=None):
+    rpath = write_failure(job_id, error)
+    extra = _finish_timings(timings, started, "failed")
+    update_job_completed(job_id, rpath, status="failed", pages=pages_processed, title=title_generated, extra=extra)
+    emit_status(job_id, "failed", error=str(error))
+    child_finished(job_id)
+
+def complete_from_cache(job_id: str, cached: dict, timings=None, started=None):
+    """
+    Finish a job from a cached result without any remote call.
+    """
+    result = {"job_id": job_id}
+    # entries written before document_url was dropped from CACHEABLE_FIELDS may still carry it
+    result.update({k: v for k, v in cached.items() if k in CACHEABLE_FIELDS})
+    result["steps"] = list(cached.get("steps") or []) + ["cache_hit"]
+    with span("job.save", timings):
+        rpath = write_result(job_id, result)
+    # cached pages cost no OCR: not counted as processed pages
+    extra = _finish_timings(timings, started, "cached")
+    update_job_completed(job_id, rpath, status="completed", pages=cached.get("pages"), title=cached.get("title"), extra=extra)
+    emit_status(job_id, "completed", title=cached.get("title"), pages=cached.get("pages"), cached=True)
+    child_finished(job_id)
+    _index_for_search(job_id, cached.get("title"), cached.get("full_markdown"))
+    prerender_docx(job_id)
+    return {"status":"completed", "job_id": job_id, "cached": True}
 
-        # Try to extract markdown
-        full_markdown = _extract_markdown_from_ocr(ocr_resp)
-        if full_markdown:
-            result["full_markdown"] = full_markdown
+# ---------- pipeline stages ----------
+# Only OCR depends on the upload result in a way that matters for the markdown; title, annotations
+# and summary just need the signed URL, so they run concurrently with OCR.
 
+def _preprocessed(ctx, report):
+    # bytes saved and time spent go to meta.json and jobs.extra
+    if report:
+        ctx.result["preprocess"] = {k: v for k, v in report.items() if k != "path"}
+    return report
+
+@stage("upload", critical=True)
+def upload_stage(ctx):
+    # upload local file to Mistral Files to get signed URL (reused when the same content was uploaded before),
+    # optimized first when PREPROCESS is on
+    if ctx.file_path:
+        ctx.signed_url = signed_url_for(ctx.file_path, ctx.content_hash, prepare=lambda path: _preprocessed(ctx, prepare_upload(path)))
+    else:
+        ctx.signed_url = ctx.document_url
+    ctx.result["document_url"] = ctx.signed_url
+
+@upload_stage.async_impl
+async def upload_stage_async(ctx):
+    if ctx.file_path:
+        async def prepare(path):
+            return _preprocessed(ctx, await prepare_upload_async(path))
+        ctx.signed_url = await signed_url_for_async(ctx.file_path, ctx.content_hash, prepare=prepare)
+    else:
+        ctx.signed_url = ctx.document_url
+    ctx.result["document_url"] = ctx.signed_url
+
+def _shard_plan(ctx):
+    # sharded: None = automatic for large local PDFs, True = always, False = never
+    if not ctx.file_path or ctx.sharded is False:
+        return None
+    return plan_shards(count_pdf_pages(ctx.file_path), force=bool(ctx.sharded))
+
+def _persist_shard(ctx, shard, ocr_resp):
+    """
+    Write each page of a shard to disk as soon as the shard returns and bump the job's progress.
+    """
+    items = page_items(ocr_resp)
+    for pos, (index, markdown, page) in enumerate(items):
+        if index not in shard and pos < len(shard):
+            index = shard[pos]
+        write_page(ctx.job_id, index, markdown)
+        with ctx.shard_lock:
+            ctx.shard_pages[index] = page
+    with ctx.shard_lock:
+        ctx.shard_usage += _pages_from_ocr(ocr_resp) or len(items)
+        done = len(ctx.shard_pages)
+    update_job_progress(ctx.job_id, pages_done=done)
+    emit(ctx.job_id, "progress", {"pages_done": done, "pages_total": ctx.shard_total})
+
+def _start_shards(ctx, shards):
+    ctx.shard_pages = {}
+    ctx.shard_usage = 0
+    ctx.shard_lock = threading.Lock()
+    ctx.shard_total = shards[-1][-1] + 1
+    update_job_progress(ctx.job_id, pages_done=0, pages_total=ctx.shard_total)
+    emit(ctx.job_id, "progress", {"pages_done": 0, "pages_total": ctx.shard_total})
+
+def _merge_shards(ctx, shards):
+    pages = [ctx.shard_pages[i] for i in sorted(ctx.shard_pages)]
+    ctx.result["ocr"] = {"pages": pages, "usage_info": {"pages_processed": ctx.shard_usage}, "shards": len(shards)}
+    ctx.result["pages_total"] = shards[-1][-1] + 1
+    ctx.pages_processed = ctx.shard_usage
+    ctx.full_markdown = "\n\n".join(p.get("markdown") or "" for p in pages) or None
+    if ctx.full_markdown:
+        ctx.result["full_markdown"] = ctx.full_markdown
+
+@stage("ocr", requires=("upload",), critical=True)
+def ocr_stage(ctx):
+    shards = _shard_plan(ctx)
+    if shards:
+        # large PDF: OCR page ranges concurrently and merge them in page order
+        _start_shards(ctx, shards)
+        def run_shard(shard):
+            resp = call("ocr", client.ocr.process, model=OCR_MODEL, document=DocumentURLChunk(document_url=ctx.signed_url), pages=shard, **_ocr_options(ctx))
+            _persist_shard(ctx, shard, resp)
+        with ThreadPoolExecutor(max_workers=max(1, OCR_SHARD_CONCURRENCY)) as pool:
+            list(pool.map(run_shard, shards))
+        _merge_shards(ctx, shards)
+        _ocr_annotations(ctx, ctx.result["ocr"])
+        return
+    ocr_resp = call("ocr", client.ocr.process, model=OCR_MODEL, document=DocumentURLChunk(document_url=ctx.signed_url), **_ocr_options(ctx))
+    ctx.pages_processed = _pages_from_ocr(ocr_resp)
+    ctx.full_markdown = _apply_ocr(ctx.result, ocr_resp)
+    _ocr_annotations(ctx, ocr_resp)
+
+@ocr_stage.async_impl
+async def ocr_stage_async(ctx):
+    aclient = get_async_client()
+    shards = await asyncio.to_thread(_shard_plan, ctx)
+    if shards:
+        await asyncio.to_thread(_start_shards, ctx, shards)
+        sem = asyncio.Semaphore(max(1, OCR_SHARD_CONCURRENCY))
+        async def run_shard(shard):
+            async with sem:
+                resp = await acall("ocr", aclient.ocr.process_async, model=OCR_MODEL, document=DocumentURLChunk(document_url=ctx.signed_url), pages=shard, **_ocr_options(ctx))
+            await asyncio.to_thread(_persist_shard, ctx, shard, resp)
+        await asyncio.gather(*(run_shard(shard) for shard in shards))
+        _merge_shards(ctx, shards)
+        _ocr_annotations(ctx, ctx.result["ocr"])
+        return
+    ocr_resp = await acall("ocr", aclient.ocr.process_async, model=OCR_MODEL, document=DocumentURLChunk(document_url=ctx.signed_url), **_ocr_options(ctx))
+    ctx.pages_processed = _pages_from_ocr(ocr_resp)
+    ctx.full_markdown = _apply_ocr(ctx.result, ocr_resp)
+    _ocr_annotations(ctx, ocr_resp)
+
+# Generate title using mistral-small-latest (best-effort, falls back to the markdown heading)
+@stage("title", requires=("upload",), when=lambda ctx: not (PIPELINE_CONSOLIDATED and ctx.do_qna))
+def title_stage(ctx):
+    chat_resp = call("chat", client.chat.complete, model=_qna_model(), messages=_title_messages(ctx.signed_url))
+    ctx.model_title = _title_from_chat(chat_resp)
+
+@title_stage.async_impl
+async def title_stage_async(ctx):
+    chat_resp = await acall("chat", get_async_client().chat.complete_async, model=_qna_model(), messages=_title_messages(ctx.signed_url))
+    ctx.model_title = _title_from_chat(chat_resp)
+
+@stage("annotations", requires=("upload",), when=lambda ctx: ctx.do_annotations and ctx.annotation_schema and not PIPELINE_CONSOLIDATED)
+def annotations_stage(ctx):
+    ann = call("ocr", client.ocr.process, model=OCR_MODEL, document=DocumentURLChunk(document_url=ctx.signed_url), bbox_annotation_format=_annotation_format(ctx.annotation_schema), include_image_base64=False)
+    ctx.result["annotations"] = ann
+
+@annotations_stage.async_impl
+async def annotations_stage_async(ctx):
+    ann = await acall("ocr", get_async_client().ocr.process_async, model=OCR_MODEL, document=DocumentURLChunk(document_url=ctx.signed_url), bbox_annotation_format=_annotation_format(ctx.annotation_schema), include_image_base64=False)
+    ctx.result["annotations"] = ann
+
+# optional QnA immediate summary
+@stage("summary", requires=("upload",), when=lambda ctx: ctx.do_qna and not PIPELINE_CONSOLIDATED, step="qna_done")
+def summary_stage(ctx):
+    chat_resp = call("chat", client.chat.complete, model=_qna_model(), messages=_summary_messages(ctx.signed_url))
+    ctx.result["qna_summary"] = chat_resp.choices[0].message.content
+
+@summary_stage.async_impl
+async def summary_stage_async(ctx):
+    chat_resp = await acall("chat", get_async_client().chat.complete_async, model=_qna_model(), messages=_summary_messages(ctx.signed_url))
+    ctx.result["qna_summary"] = chat_resp.choices[0].message.content
+
+# consolidated mode: title and summary from one structured chat call (the title falls back to the markdown heading)
+@stage("title_summary", requires=("upload",), when=lambda ctx: ctx.do_qna and PIPELINE_CONSOLIDATED, step="qna_done")
+def title_summary_stage(ctx):
+    chat_resp = call("chat", client.chat.complete, model=_qna_model(), messages=_title_summary_messages(ctx.signed_url), response_format={"type": "json_object"})
+    _apply_title_summary(ctx, chat_resp)
+
+@title_summary_stage.async_impl
+async def title_summary_stage_async(ctx):
+    chat_resp = await acall("chat", get_async_client().chat.complete_async, model=_qna_model(), messages=_title_summary_messages(ctx.signed_url), response_format={"type": "json_object"})
+    _apply_title_summary(ctx, chat_resp)
+
+# chunk + BM25 index of the markdown for local retrieval QnA (pure local work)
+@stage("retrieval", requires=("ocr",), when=lambda ctx: bool(ctx.full_markdown), step="index_done")
+def retrieval_stage(ctx):
+    retrieval.index_document(ctx.job_id, ctx.full_markdown)
+
+# extra stages registered by plugin modules
+for _mod in filter(None, (m.strip() for m in os.environ.get("PIPELINE_PLUGINS", "").split(","))):
+    importlib.import_module(_mod)
+
+def _step_event(ctx, name, status):
+    emit(ctx.job_id, "step", {"stage": name, "status": status})
+
+def _job_context(job_id, file_path, document_url, do_annotations, annotation_schema, do_qna, content_hash, sharded):
+    return JobContext(job_id, file_path=file_path, document_url=document_url, do_annotations=do_annotations,
+                      annotation_schema=annotation_schema, do_qna=do_qna, content_hash=content_hash, sharded=sharded,
+                      on_step=_step_event)
+
+def process_document(file_path: str = None, document_url: str = None, job_id: str = None, do_annotations: bool = False, annotation_schema: dict = None, do_qna: bool = False, content_hash: str = None, sharded: bool = None):
+    started, timings = time.perf_counter(), {}
+    # identical content with identical options may have been processed while this job was queued
+    cache_key = result_cache_key(content_hash, do_annotations, annotation_schema, do_qna)
+    with span("job.cache_lookup", timings):
+        cached = lookup_result(cache_key, record=False)
+    if cached:
+        return complete_from_cache(job_id, cached, timings, started)
+
+    ctx = _job_context(job_id, file_path, document_url, do_annotations, annotation_schema, do_qna, content_hash, sharded)
+    timings.update(stages=ctx.timings, stage_waits=ctx.stage_waits)
+    try:
+        run_stages(ctx)
         # Derive title: first prefer model-generated title, otherwise from markdown
-        # Generate title using mistral-small-latest (best-effort)
-        try:
-            model = os.environ.get("DOC_QNA_MODEL", "mistral-small-latest")
-            messages = [
-                {"role":"user", "content":[{"type":"text", "text":"Create a short descriptive title (max 8 words) for the following document. Return only the title as plain text."}, {"type":"document_url","document_url": signed_url}]}
-            ]
-            chat_resp = client.chat.complete(model=model, messages=messages)
-            try:
-                title_generated = chat_resp.choices[0].message.content
-            except Exception:
-                title_generated = str(chat_resp)
-            if isinstance(title_generated, (list, dict)):
-                title_generated = str(title_generated)
-            if title_generated:
-                title_generated = title_generated.strip().strip('"').strip("'")
-                # keep short
-                title_generated = title_generated[:120]
-                result["title"] = title_generated
-        except Exception:
-            title_generated = None
-
-        # If no title from model, try extract from markdown
-        if not title_generated and full_markdown:
-            t = _extract_title_from_markdown(full_markdown)
-            if t:
-                title_generated = t
-                result["title"] = title_generated
-
-        # optional annotations
-        if do_annotations and annotation_schema:
-            ann = client.ocr.process(model="mistral-ocr-latest", document=DocumentURLChunk(document_url=signed_url), bbox_annotation_format={"type":"json_schema", "json_schema": annotation_schema}, include_image_base64=False)
-            result["annotations"] = ann
-            result["steps"].append("annotations_done")
-
-        # optional QnA immediate summary
-        if do_qna:
-            try:
-                model2 = os.environ.get("DOC_QNA_MODEL", "mistral-small-latest")
-                messages = [
-                    {"role":"user", "content":[{"type":"text","text":"Provide a short summary of the document."}, {"type":"document_url","document_url":signed_url}]}
-                ]
-                chat_resp2 = client.chat.complete(model=model2, messages=messages)
-                result["qna_summary"] = chat_resp2.choices[0].message.content
-                result["steps"].append("qna_done")
-            except Exception:
-                pass
-
-        # Save result JSON
-        rpath = result_path(job_id)
-        with open(rpath, "w", encoding="utf-8") as f:
-            try:
-                json.dump(result, f, default=str, ensure_ascii=False, indent=2)
-            except TypeError:
-                f.write(str(result))
-
-        # update DB with title (if extracted or generated)
-        update_job_completed(job_id, rpath, status="completed", pages=pages_processed, title=title_generated)
-        # also ensure title field updated if not set by update_job_completed above
-        if title_generated:
-            try:
-                update_job_title(job_id, title_generated)
-            except Exception:
-                pass
-
-        return {"status":"completed", "job_id": job_id}
+        title_generated = _apply_title(ctx.result, ctx.model_title, ctx.full_markdown)
+        return _save_completed(job_id, ctx.result, ctx.pages_processed, title_generated, cache_key, content_hash, timings, started)
+    except Exception as e:
+        _save_failed(job_id, e, ctx.pages_processed, ctx.model_title, timings, started)
+        raise
+
+async def process_document_async(file_path: str = None, document_url: str = None, job_id: str = None, do_annotations: bool = False, annotation_schema: dict = None, do_qna: bool = False, content_hash: str = None, sharded: bool = None):
+    """
+    Same pipeline as process_document, using the SDK's async methods over the pooled async client.
+    Local disk / SQLite work runs in threads so the event loop only ever waits on the network.
+    """
+    started, timings = time.perf_counter(), {}
+    cache_key = result_cache_key(content_hash, do_annotations, annotation_schema, do_qna)
+    with span("job.cache_lookup", timings):
+        cached = await asyncio.to_thread(lookup_result, cache_key, False)
+    if cached:
+        return await asyncio.to_thread(complete_from_cache, job_id, cached, timings, started)
+
+    ctx = _job_context(job_id, file_path, document_url, do_annotations, annotation_schema, do_qna, content_hash, sharded)
+    timings.update(stages=ctx.timings, stage_waits=ctx.stage_waits)
+    try:
+        await run_stages_async(ctx)
+        title_generated = _apply_title(ctx.result, ctx.model_title, ctx.full_markdown)
+        return await asyncio.to_thread(_save_completed, job_id, ctx.result, ctx.pages_processed, title_generated, cache_key, content_hash, timings, started)
     except Exception as e:
-        err_obj = {"status":"failed", "error": str(e)}
-        with open(result_path(job_id), "w", encoding="utf-8") as f:
-            json.dump(err_obj, f, ensure_ascii=False, indent=2)
-        update_job_completed(job_id, result_path(job_id), status="failed", pages=pages_processed, title=title_generated)
+        await asyncio.to_thread(_save_failed, job_id, e, ctx.pages_processed, ctx.model_title, timings, started)
         raise
@@ -1,11 +1,16 @@
 # app/utils.py
 import os
+import queue
 import sqlite3
 import uuid
+import base64
+import hashlib
+import threading
 from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv
 import json
+import aiofiles
 
 load_dotenv()
 
@@ -22,39 +27,138 @@ RESULTS.mkdir(parents=True, exist_ok=True)
 def new_job_id():
     return uuid.uuid4().hex
 
-def save_upload_file(upload_file):
+# largest accepted upload (0 = unlimited) and the read/write block size of the upload path
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "200"))
+UPLOAD_CHUNK_BYTES = int(os.environ.get("UPLOAD_CHUNK_KB", "1024")) * 1024
+
+def max_upload_bytes():
+    return MAX_UPLOAD_MB * 1024 * 1024 if MAX_UPLOAD_MB > 0 else None
+
+class UploadTooLarge(Exception):
+    pass
+
+async def save_upload_file_async(upload_file, max_bytes=None):
     """
-    Save a Starlette UploadFile to disk. Returns (file_path, job_id, original_filename).
+    Save a Starlette UploadFile to disk with aiofiles, hashing and counting bytes in the same pass;
+    stops (removing the partial file) as soon as max_bytes is exceeded.
+    Returns (file_path, job_id, original_filename, content_hash, size_bytes).
     """
     job_id = new_job_id()
     original_name = upload_file.filename
-    safe_name = f"{job_id}_{original_name}"
-    dest = UPLOADS / safe_name
-    with open(dest, "wb") as f:
-        while True:
-            chunk = upload_file.file.read(1024 * 1024)
-            if not chunk:
-                break
-            f.write(chunk)
-    return str(dest), job_id, original_name
+    dest = UPLOADS / f"{job_id}_{original_name}"
+    h = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(dest, "wb") as f:
+            while True:
+                chunk = await upload_file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise UploadTooLarge(f"upload exceeds {max_bytes} bytes")
+                h.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        try:
+            os.remove(dest)
+        except OSError:
+            pass
+        raise
+    return str(dest), job_id, original_name, h.hexdigest(), size
 
 def result_path(job_id: str):
     return str(RESULTS / f"{job_id}.json")
 
 # ---------- SQLite helpers ----------
-def get_db_conn():
-    conn = sqlite3.connect(str(DB_PATH), check_same_thread=False)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "16"))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "10000"))
+
+class PooledConnection(sqlite3.Connection):
+    """
+    sqlite3 connection whose close() hands it back to the pool instead of closing it, so the
+    existing `conn = get_db_conn() ... conn.close()` call sites reuse connections transparently.
+    """
+    def close(self):
+        _release_conn(self)
+
+    def close_for_real(self):
+        super().close()
+
+_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+_pool_lock = threading.Lock()
+_wal_checked = False
+
+def _new_conn():
+    global _wal_checked
+    conn = sqlite3.connect(str(DB_PATH), check_same_thread=False, timeout=DB_BUSY_TIMEOUT_MS / 1000.0, factory=PooledConnection)
     conn.row_factory = sqlite3.Row
+    # WAL lets /api/jobs readers run while workers write; NORMAL sync is safe with WAL
+    with _pool_lock:
+        if not _wal_checked:
+            conn.execute("PRAGMA journal_mode=WAL")
+            _wal_checked = True
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-16000")
     return conn
 
+def get_db_conn():
+    """
+    Check a connection out of the thread-safe pool (a new one is opened when the pool is empty).
+    Calling close() on it returns it to the pool.
+    """
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return _new_conn()
+
+def _release_conn(conn):
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close_for_real()
+    except sqlite3.Error:
+        conn.close_for_real()
+
+def close_db_pool():
+    while True:
+        try:
+            _pool.get_nowait().close_for_real()
+        except queue.Empty:
+            return
+
 def _table_columns(conn, table_name):
     cur = conn.execute(f"PRAGMA table_info({table_name})")
     return [row["name"] for row in cur.fetchall()]
 
+JOBS_COLUMNS = {
+    "job_id": "TEXT PRIMARY KEY",
+    "title": "TEXT",
+    "filename": "TEXT",
+    "filepath": "TEXT",
+    "resultpath": "TEXT",
+    "status": "TEXT",
+    "created_at": "TEXT",
+    "completed_at": "TEXT",
+    "pages": "INTEGER",
+    "size_bytes": "INTEGER",
+    "extra": "TEXT",
+    "content_hash": "TEXT",
+    "pages_done": "INTEGER",
+    "pages_total": "INTEGER",
+    "batch_id": "TEXT"
+}
+
 def init_db():
     """
     Initialize DB and perform simple migrations.
     Ensures table 'jobs' exists with expected columns; if columns are missing, ALTER TABLE ADD COLUMN.
+    Also creates the auxiliary tables (result cache, QnA cache, cache counters, job queue, job events, batches,
+    remote file registry, search index) and the indexes used by listings and lookups if they don't exist yet.
     """
     conn = get_db_conn()
     try:
@@ -75,71 +179,238 @@ def init_db():
               completed_at TEXT,
               pages INTEGER,
               size_bytes INTEGER,
-              extra TEXT
+              extra TEXT,
+              content_hash TEXT,
+              pages_done INTEGER,
+              pages_total INTEGER,
+              batch_id TEXT
             )
             """)
             conn.commit()
-            return
+        else:
+            # If table exists, check columns and add missing ones
+            existing = _table_columns(conn, "jobs")
+            for col, coltype in JOBS_COLUMNS.items():
+                if col not in existing:
+                    cur.execute(f"ALTER TABLE jobs ADD COLUMN {col} {coltype}")
+                    conn.commit()
+
+        # result cache: content hash + options -> cached result file
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS result_cache (
+          cache_key TEXT PRIMARY KEY,
+          content_hash TEXT,
+          cachepath TEXT,
+          pages INTEGER,
+          title TEXT,
+          size_bytes INTEGER,
+          created_at TEXT,
+          last_used_at TEXT,
+          hits INTEGER DEFAULT 0
+        )
+        """)
+        # QnA answer cache: content hash + model + normalized question -> answer
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS qna_cache (
+          cache_key TEXT PRIMARY KEY,
+          content_hash TEXT,
+          model TEXT,
+          question TEXT,
+          answer TEXT,
+          extra TEXT,
+          created_at TEXT,
+          last_used_at TEXT,
+          hits INTEGER DEFAULT 0
+        )
+        """)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS cache_stats (
+          cache TEXT PRIMARY KEY,
+          hits INTEGER DEFAULT 0,
+          misses INTEGER DEFAULT 0
+        )
+        """)
+        # durable work queue: workers claim rows with a lease that they keep renewing
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS job_queue (
+          job_id TEXT PRIMARY KEY,
+          payload TEXT,
+          status TEXT,
+          attempts INTEGER DEFAULT 0,
+          lease_owner TEXT,
+          lease_expires_at REAL,
+          enqueued_at TEXT,
+          updated_at TEXT,
+          last_error TEXT,
+          lane TEXT NOT NULL DEFAULT ''
+        )
+        """)
+        # lane: '' for interactive uploads, the batch id for batch children (fair scheduling)
+        if "lane" not in _table_columns(conn, "job_queue"):
+            cur.execute("ALTER TABLE job_queue ADD COLUMN lane TEXT NOT NULL DEFAULT ''")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_job_queue_status ON job_queue(status, enqueued_at)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_job_queue_lane ON job_queue(status, lane, enqueued_at)")
+
+        # batch ingestion: one row per batch, children are jobs rows with batch_id set
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS batches (
+          batch_id TEXT PRIMARY KEY,
+          name TEXT,
+          status TEXT,
+          total INTEGER,
+          options TEXT,
+          created_at TEXT,
+          completed_at TEXT
+        )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs(batch_id, status)")
+
+        # append-only progress events, tailed by the SSE endpoint
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS job_events (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          job_id TEXT,
+          event TEXT,
+          data TEXT,
+          created_at TEXT
+        )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events(job_id, id)")
+
+        # indexes for listing (keyset pagination + filters), dedup lookups and cache eviction
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created_at, job_id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at, job_id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_content_hash ON jobs(content_hash)")
+        # throughput gauges of /metrics scan recently completed jobs
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_completed ON jobs(completed_at)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_result_cache_last_used ON result_cache(last_used_at)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_qna_cache_last_used ON qna_cache(last_used_at)")
+
+        # files uploaded to Mistral, one per content hash, with the current signed URL
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS remote_files (
+          content_hash TEXT PRIMARY KEY,
+          file_id TEXT NOT NULL,
+          file_name TEXT,
+          signed_url TEXT,
+          url_expires_at REAL,
+          uploaded_at TEXT,
+          last_used_at REAL
+        )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_remote_files_last_used ON remote_files(last_used_at)")
 
-        # If table exists, check columns and add missing ones
-        existing = _table_columns(conn, "jobs")
-        required = {
-            "job_id": "TEXT PRIMARY KEY",
-            "title": "TEXT",
-            "filename": "TEXT",
-            "filepath": "TEXT",
-            "resultpath": "TEXT",
-            "status": "TEXT",
-            "created_at": "TEXT",
-            "completed_at": "TEXT",
-            "pages": "INTEGER",
-            "size_bytes": "INTEGER",
-            "extra": "TEXT"
-        }
-        for col, coltype in required.items():
-            if col not in existing:
-                cur.execute(f"ALTER TABLE jobs ADD COLUMN {col} {coltype}")
-                conn.commit()
+        # full-text search: search_docs maps a job to the rowid of its documents_fts entry
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS search_docs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id TEXT UNIQUE NOT NULL,
+            indexed_at TEXT
+        )
+        """)
+        cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+            title, body, tokenize = 'unicode61 remove_diacritics 2'
+        )
+        """)
+        conn.commit()
     finally:
         conn.close()
 
-def insert_job(job_id, title, filename, filepath, size_bytes):
+def insert_job(job_id, title, filename, filepath, size_bytes, content_hash=None):
     conn = get_db_conn()
     with conn:
         conn.execute("""
-        INSERT INTO jobs(job_id, title, filename, filepath, resultpath, status, created_at, pages, size_bytes, extra)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (job_id, title, filename, filepath, None, "pending", datetime.utcnow().isoformat(), None, size_bytes, json.dumps({})))
+        INSERT INTO jobs(job_id, title, filename, filepath, resultpath, status, created_at, pages, size_bytes, extra, content_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (job_id, title, filename, filepath, None, "pending", datetime.utcnow().isoformat(), None, size_bytes, json.dumps({}), content_hash))
     conn.close()
 
-def update_job_completed(job_id, resultpath, status="completed", pages=None, title=None):
+# extra is merged into jobs.extra (JSON merge patch), e.g. {"timings": {...}}
+_MERGE_EXTRA = "extra = json_patch(COALESCE(NULLIF(extra, ''), '{}'), ?)"
+
+def update_job_completed(job_id, resultpath, status="completed", pages=None, title=None, extra=None):
     conn = get_db_conn()
     with conn:
+        sets, params = ["resultpath = ?", "status = ?", "completed_at = ?", "pages = ?"], [resultpath, status, datetime.utcnow().isoformat(), pages]
         if title is not None:
-            conn.execute("""
-            UPDATE jobs SET resultpath = ?, status = ?, completed_at = ?, pages = ?, title = ?
-            WHERE job_id = ?
-            """, (resultpath, status, datetime.utcnow().isoformat(), pages, title, job_id))
-        else:
-            conn.execute("""
-            UPDATE jobs SET resultpath = ?, status = ?, completed_at = ?, pages = ?
-            WHERE job_id = ?
-            """, (resultpath, status, datetime.utcnow().isoformat(), pages, job_id))
+            sets.append("title = ?")
+            params.append(title)
+        if extra:
+            sets.append(_MERGE_EXTRA)
+            params.append(json.dumps(extra))
+        conn.execute(f"UPDATE jobs SET {', '.join(sets)} WHERE job_id = ?", (*params, job_id))
     conn.close()
 
-def update_job_title(job_id, title):
+def update_job_status(job_id, status, extra=None):
     conn = get_db_conn()
     with conn:
-        conn.execute("UPDATE jobs SET title = ? WHERE job_id = ?", (title, job_id))
+        if extra:
+            conn.execute(f"UPDATE jobs SET status = ?, {_MERGE_EXTRA} WHERE job_id = ?", (status, json.dumps(extra), job_id))
+        else:
+            conn.execute("UPDATE jobs SET status = ? WHERE job_id = ?", (status, job_id))
     conn.close()
 
-def list_jobs(limit=100):
+def update_job_progress(job_id, pages_done=None, pages_total=None):
     conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
-    rows = cur.fetchall()
+    with conn:
+        if pages_total is not None:
+            conn.execute("UPDATE jobs SET pages_done = ?, pages_total = ? WHERE job_id = ?", (pages_done or 0, pages_total, job_id))
+        else:
+            # shards finish in any order: never move progress backwards
+            conn.execute("UPDATE jobs SET pages_done = MAX(COALESCE(pages_done, 0), ?) WHERE job_id = ?", (pages_done, job_id))
     conn.close()
-    return [dict(r) for r in rows]
+
+def _encode_cursor(created_at, job_id):
+    raw = json.dumps([created_at, job_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, job_id = json.loads(raw)
+        return str(created_at), str(job_id)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+def list_jobs_page(limit=100, cursor=None, status=None, created_from=None, created_to=None, batch_id=None):
+    """
+    Keyset-paginated job listing, newest first. Returns (rows, next_cursor); next_cursor is None
+    on the last page. Uses the (created_at, job_id) / (status, created_at, job_id) indexes, so the
+    cost of a page does not grow with the offset.
+    """
+    where, params = [], []
+    if status:
+        where.append("status = ?")
+        params.append(status)
+    if batch_id:
+        where.append("batch_id = ?")
+        params.append(batch_id)
+    if created_from:
+        where.append("created_at >= ?")
+        params.append(created_from)
+    if created_to:
+        where.append("created_at < ?")
+        params.append(created_to)
+    if cursor:
+        created_at, job_id = _decode_cursor(cursor)
+        where.append("(created_at, job_id) < (?, ?)")
+        params.extend([created_at, job_id])
+    sql = "SELECT * FROM jobs"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY created_at DESC, job_id DESC LIMIT ?"
+    params.append(limit + 1)
+    conn = get_db_conn()
+    try:
+        rows = [dict(r) for r in conn.execute(sql, params).fetchall()]
+    finally:
+        conn.close()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]["created_at"], rows[-1]["job_id"])
+    return rows, next_cursor
 
 def get_job(job_id):
     conn = get_db_conn()
@@ -0,0 +1,240 @@
+# app/worker.py
+"""
+Standalone OCR worker. Claims jobs from the SQLite queue in jobs.db and runs process_document.
+
+    python -m app.worker --concurrency 4
+    python -m app.worker --async --concurrency 200
+
+The default mode uses one thread per job. --async runs jobs as coroutines on one event loop
+(process_document_async over a pooled HTTP client), bounded by a semaphore instead of threads,
+which suits the network-bound pipeline much better at high concurrency.
+
+Several worker processes can run next to the uvicorn API (and each other); leases that are
+not renewed (crashed / killed worker) are put back in the queue by any live worker.
+"""
+import os
+import uuid
+import signal
+import socket
+import logging
+import asyncio
+import argparse
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from .utils import init_db, update_job_status
+from .jobqueue import claim_job, heartbeat, finish_job, requeue_expired, QUEUE_LEASE_SECONDS
+from .events import emit_status
+from .tasks import process_document, process_document_async
+from .mistral_client import close_async_client
+from .metrics import JOB_QUEUE_SECONDS, serve as serve_metrics
+
+log = logging.getLogger("app.worker")
+
+def _started(job):
+    """jobs.extra patch for a claimed job: how long it waited in the queue (also observed as a metric)."""
+    try:
+        waited = max(0.0, (datetime.utcnow() - datetime.fromisoformat(job["enqueued_at"])).total_seconds())
+    except (KeyError, TypeError, ValueError):
+        return None
+    JOB_QUEUE_SECONDS.observe(waited)
+    return {"timings": {"queue_wait": round(waited, 4)}}
+
+class Worker:
+    def __init__(self, concurrency=1, lease_seconds=QUEUE_LEASE_SECONDS, poll_interval=1.0, worker_id=None):
+        self.concurrency = max(1, int(concurrency))
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._active = set()
+        self._active_lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.concurrency):
+            t = threading.Thread(target=self._run_loop, name=f"ocr-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._heartbeat_loop, name="ocr-worker-heartbeat", daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def stop(self, wait=False):
+        self._stop.set()
+        self._wake.set()
+        if wait:
+            for t in self._threads:
+                t.join()
+
+    def notify(self):
+        """Wake idle threads right away (used by the API after enqueueing)."""
+        self._wake.set()
+
+    def _heartbeat_loop(self):
+        interval = max(1.0, self.lease_seconds / 3.0)
+        while not self._stop.wait(interval):
+            with self._active_lock:
+                active = list(self._active)
+            try:
+                heartbeat(active, self.worker_id, self.lease_seconds)
+                requeue_expired()
+            except Exception:
+                log.exception("heartbeat failed")
+
+    def _run_loop(self):
+        while not self._stop.is_set():
+            try:
+                job = claim_job(self.worker_id, self.lease_seconds)
+            except Exception:
+                log.exception("claim failed")
+                job = None
+            if not job:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._run_job(job)
+
+    def _run_job(self, job):
+        job_id = job["job_id"]
+        with self._active_lock:
+            self._active.add(job_id)
+        try:
+            update_job_status(job_id, "processing", extra=_started(job))
+            emit_status(job_id, "processing", attempt=job["attempts"])
+            process_document(job_id=job_id, **job["payload"])
+            finish_job(job_id, self.worker_id, status="done")
+        except Exception as e:
+            # process_document already recorded the failure on the job itself
+            log.warning("job %s failed: %s", job_id, e)
+            finish_job(job_id, self.worker_id, status="failed", error=str(e))
+        finally:
+            with self._active_lock:
+                self._active.discard(job_id)
+
+class AsyncWorker:
+    """
+    Queue consumer running on an asyncio loop. At most `concurrency` jobs are in flight,
+    enforced by a semaphore; claims and other SQLite calls run in threads.
+    """
+    def __init__(self, concurrency=100, lease_seconds=QUEUE_LEASE_SECONDS, poll_interval=1.0, worker_id=None):
+        self.concurrency = max(1, int(concurrency))
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._stop = None
+        self._active = set()
+        self._tasks = set()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    async def run(self):
+        self._stop = asyncio.Event()
+        sem = asyncio.Semaphore(self.concurrency)
+        hb = asyncio.create_task(self._heartbeat_loop())
+        try:
+            while not self._stop.is_set():
+                await sem.acquire()
+                try:
+                    job = await asyncio.to_thread(claim_job, self.worker_id, self.lease_seconds)
+                except Exception:
+                    log.exception("claim failed")
+                    job = None
+                if not job:
+                    sem.release()
+                    try:
+                        await asyncio.wait_for(self._stop.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                task = asyncio.create_task(self._run_job(job, sem))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            # let running jobs finish
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            hb.cancel()
+            await close_async_client()
+
+    async def _heartbeat_loop(self):
+        interval = max(1.0, self.lease_seconds / 3.0)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(heartbeat, list(self._active), self.worker_id, self.lease_seconds)
+                await asyncio.to_thread(requeue_expired)
+            except Exception:
+                log.exception("heartbeat failed")
+
+    async def _run_job(self, job, sem):
+        job_id = job["job_id"]
+        self._active.add(job_id)
+        try:
+            await asyncio.to_thread(update_job_status, job_id, "processing", _started(job))
+            await asyncio.to_thread(emit_status, job_id, "processing", attempt=job["attempts"])
+            await process_document_async(job_id=job_id, **job["payload"])
+            await asyncio.to_thread(finish_job, job_id, self.worker_id, "done")
+        except Exception as e:
+            log.warning("job %s failed: %s", job_id, e)
+            await asyncio.to_thread(finish_job, job_id, self.worker_id, "failed", str(e))
+        finally:
+            self._active.discard(job_id)
+            sem.release()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mistral OCR queue worker")
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get("MAX_WORKERS", "3")), help="jobs processed in parallel by this process")
+    parser.add_argument("--lease-seconds", type=int, default=QUEUE_LEASE_SECONDS, help="lease length; renewed every third of it while a job runs")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds to wait when the queue is empty")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run jobs as coroutines on one event loop (semaphore-bounded)")
+    parser.add_argument("--metrics-port", type=int, default=int(os.environ.get("WORKER_METRICS_PORT", "0")), help="serve Prometheus /metrics of this process on this port (0 = off)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    init_db()
+    requeue_expired()
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+        log.info("metrics on :%d/metrics", args.metrics_port)
+
+    if args.use_async:
+        asyncio.run(_run_async(args))
+        return
+
+    worker = Worker(args.concurrency, args.lease_seconds, args.poll_interval)
+    stop = threading.Event()
+
+    def _shutdown(signum, frame):
+        log.info("signal %s received, stopping %s", signum, worker.worker_id)
+        stop.set()
+
+    signal.signal(signal.SIGINT, _shutdown)
+    signal.signal(signal.SIGTERM, _shutdown)
+
+    log.info("worker %s started with concurrency %d", worker.worker_id, worker.concurrency)
+    worker.start()
+    stop.wait()
+    # let running jobs finish; unfinished leases expire and are re-queued elsewhere
+    worker.stop(wait=True)
+
+async def _run_async(args):
+    worker = AsyncWorker(args.concurrency, args.lease_seconds, args.poll_interval)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, worker.stop)
+        except NotImplementedError:
+            # Windows: fall back to KeyboardInterrupt
+            pass
+    log.info("async worker %s started with concurrency %d", worker.worker_id, worker.concurrency)
+    await worker.run()
+
+if __name__ == "__main__":
+    main()
@@ -113,20 +113,72 @@ $(function () {
     }
   }
 
-  // polling
+  // job status: pushed over Server-Sent Events, polling only as a fallback
+  let eventSource = null;
+
+  function showStatus(j) {
+    let label = j.status;
+    if (j.pages_total)
+      label += ", " + (j.pages_done || 0) + "/" + j.pages_total + " pages";
+    $("#jobId").text(j.job_id + " (" + label + ")");
+  }
+
+  function jobFinished(jobId) {
+    fetchResult(jobId);
+    loadHistory();
+  }
+
   function startPolling(jobId) {
+    if (pollInterval) clearInterval(pollInterval);
+    if (eventSource) {
+      eventSource.close();
+      eventSource = null;
+    }
+    if (window.EventSource) {
+      const state = { job_id: jobId, status: "pending" };
+      const es = new EventSource("/api/events/" + jobId);
+      eventSource = es;
+      es.addEventListener("status", (e) => {
+        Object.assign(state, JSON.parse(e.data));
+        showStatus(state);
+        if (state.status === "completed" || state.status === "failed") {
+          es.close();
+          eventSource = null;
+          jobFinished(jobId);
+        }
+      });
+      es.addEventListener("progress", (e) => {
+        Object.assign(state, JSON.parse(e.data));
+        showStatus(state);
+      });
+      es.addEventListener("step", (e) => {
+        const d = JSON.parse(e.data);
+        $("#jobId").text(jobId + " (" + state.status + ", " + d.stage + " " + d.status + ")");
+      });
+      es.onerror = function () {
+        // stream unavailable (proxy, old server): fall back to polling
+        if (es.readyState === EventSource.CLOSED && eventSource === es) {
+          eventSource = null;
+          pollStatus(jobId);
+        }
+      };
+      return;
+    }
+    pollStatus(jobId);
+  }
+
+  function pollStatus(jobId) {
     if (pollInterval) clearInterval(pollInterval);
     pollInterval = setInterval(async () => {
       try {
         const r = await fetch("/api/status/" + jobId);
         if (!r.ok) return;
         const j = await r.json();
-        $("#jobId").text(j.job_id + " (" + j.status + ")");
+        showStatus(j);
         if (j.status === "completed" || j.status === "failed") {
           clearInterval(pollInterval);
           pollInterval = null;
-          fetchResult(jobId);
-          loadHistory();
+          jobFinished(jobId);
         }
       } catch (e) {
         console.warn(e);
@@ -137,7 +189,8 @@ $(function () {
   // fetch result and render markdown
   async function fetchResult(jobId) {
     try {
-      const r = await fetch("/api/result/" + jobId);
+      // markdown + metadata only: the raw OCR payload isn't needed to render
+      const r = await fetch("/api/result/" + jobId + "?include=meta,markdown");
       if (!r.ok) {
         $("#ocrRendered").html(
           '<div class="text-sm text-red-500">Could not load result</div>'
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""
+End-to-end throughput benchmark: upload -> status -> result, at several concurrency levels.
+
+    python scripts/bench_e2e.py --spawn --workers 8 --concurrency 1,4,16,64 --jobs 64
+    python scripts/bench_e2e.py --url http://127.0.0.1:8000 --concurrency 8 --jobs 100
+
+--spawn starts scripts/fake_mistral.py and the API (uvicorn, embedded workers, throw-away
+STORAGE_PATH) pointed at it, so the run needs neither the live API nor a key; --fake-args are
+passed to the fake server (e.g. "--latency-ms 200 --rate-429 0.05"). Against an existing API, point
+it at a fake server with MISTRAL_SERVER_URL yourself.
+
+Per level the report shows jobs/sec, end-to-end and upload latency percentiles, the API's event
+loop lag (from the ocr_event_loop_lag_seconds histogram of /metrics, so it is the server's loop,
+not this client's) and the API process RSS sampled during the run. Every upload has unique
+content, so the result cache never short-circuits a job.
+"""
+import os
+import re
+import sys
+import time
+import shlex
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_BUCKET = re.compile(r'^ocr_event_loop_lag_seconds_bucket\{le="([^"]+)"\} (\S+)$', re.M)
+_RSS = re.compile(r"^process_resident_memory_bytes (\S+)$", re.M)
+
+def _pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+def _fake_pdf(pages, size):
+    # just enough structure for page counting (app and fake server); random padding keeps it unique
+    body = b"%PDF-1.4\n" + b"".join(b"%d 0 obj << /Type /Page >> endobj\n" % (i + 3) for i in range(pages))
+    return body + b"%" + os.urandom(max(0, size - len(body)) // 2).hex().encode() + b"\n%%EOF\n"
+
+def _lag_buckets(text):
+    return {float(le) if le != "+Inf" else float("inf"): float(n) for le, n in _BUCKET.findall(text)}
+
+def _lag_quantile(before, after, q):
+    """Upper bound of the bucket holding quantile q of the observations made between two scrapes."""
+    bounds = sorted(after)
+    counts = [after[b] - before.get(b, 0.0) for b in bounds]
+    total = counts[-1] if counts else 0
+    if total <= 0:
+        return None
+    for bound, cumulative in zip(bounds, counts):
+        if cumulative >= q * total:
+            return bound
+    return bounds[-1]
+
+async def _metrics(client, url):
+    try:
+        r = await client.get(f"{url}/metrics")
+        return r.text if r.status_code == 200 else ""
+    except httpx.HTTPError:
+        return ""
+
+async def _sample_rss(client, url, stop, samples):
+    while not stop.is_set():
+        m = _RSS.search(await _metrics(client, url))
+        if m:
+            samples.append(float(m.group(1)))
+        try:
+            await asyncio.wait_for(stop.wait(), 0.5)
+        except asyncio.TimeoutError:
+            pass
+
+async def _client(client, args, queue, e2e, upload_lat, errors):
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        t0 = time.perf_counter()
+        try:
+            r = await client.post(f"{args.url}/api/upload", files={"file": ("bench.pdf", _fake_pdf(args.pages, args.size_kb * 1024), "application/pdf")})
+            if r.status_code != 200:
+                errors.append(f"upload {r.status_code}")
+                continue
+            upload_lat.append(time.perf_counter() - t0)
+            job_id = r.json()["job_id"]
+            deadline = t0 + args.timeout
+            status = None
+            while time.perf_counter() < deadline:
+                status = (await client.get(f"{args.url}/api/status/{job_id}")).json().get("status")
+                if status in ("completed", "failed"):
+                    break
+                await asyncio.sleep(args.poll)
+            if status != "completed":
+                errors.append(status or "timeout")
+                continue
+            r = await client.get(f"{args.url}/api/result/{job_id}", params={"include": "meta,markdown"})
+            if r.status_code != 200:
+                errors.append(f"result {r.status_code}")
+                continue
+            e2e.append(time.perf_counter() - t0)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+
+async def run_level(args, concurrency):
+    queue = asyncio.Queue()
+    for i in range(args.jobs):
+        queue.put_nowait(i)
+    e2e, upload_lat, errors, rss = [], [], [], []
+    limits = httpx.Limits(max_connections=concurrency + 4)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(120.0), limits=limits) as client:
+        before = _lag_buckets(await _metrics(client, args.url))
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(_sample_rss(client, args.url, stop, rss))
+        t0 = time.perf_counter()
+        await asyncio.gather(*(_client(client, args, queue, e2e, upload_lat, errors) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        await sampler
+        after = _lag_buckets(await _metrics(client, args.url))
+    return {
+        "concurrency": concurrency, "ok": len(e2e), "failed": len(errors), "errors": sorted(set(errors)), "elapsed": elapsed,
+        "jobs_per_s": len(e2e) / elapsed if elapsed else 0.0,
+        "p50": _pct(e2e, 50), "p99": _pct(e2e, 99), "upload_p50": _pct(upload_lat, 50), "upload_p99": _pct(upload_lat, 99),
+        "lag_p50": _lag_quantile(before, after, 0.5), "lag_p99": _lag_quantile(before, after, 0.99),
+        "rss_peak": max(rss) if rss else None, "rss_end": rss[-1] if rss else None,
+    }
+
+def _ms(v):
+    return "   n/a" if v is None else f"{v * 1000:6.0f}" if v < float("inf") else "  >max"
+
+def _mb(v):
+    return "  n/a" if v is None else f"{v / 1024 / 1024:5.0f}"
+
+def report(rows):
+    print(f"{'conc':>5} {'ok':>5} {'fail':>5} {'jobs/s':>7} {'p50 ms':>7} {'p99 ms':>7} {'up p50':>7} {'up p99':>7} {'lag p50':>8} {'lag p99':>8} {'rss MB':>7} {'peak':>6}")
+    for r in rows:
+        print(f"{r['concurrency']:>5} {r['ok']:>5} {r['failed']:>5} {r['jobs_per_s']:>7.2f} {_ms(r['p50']):>7} {_ms(r['p99']):>7} "
+              f"{_ms(r['upload_p50']):>7} {_ms(r['upload_p99']):>7} {_ms(r['lag_p50']):>8} {_ms(r['lag_p99']):>8} {_mb(r['rss_end']):>7} {_mb(r['rss_peak']):>6}")
+        if r["errors"]:
+            print(f"      errors: {', '.join(r['errors'])}")
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_ready(url, timeout=60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=2.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+def spawn(args):
+    """Start the fake Mistral server and an API using it; returns the processes to stop."""
+    fake_port, api_port = _free_port(), _free_port()
+    fake = subprocess.Popen([sys.executable, os.path.join(ROOT, "scripts", "fake_mistral.py"), "--port", str(fake_port), *shlex.split(args.fake_args)])
+    env = dict(os.environ, MISTRAL_SERVER_URL=f"http://127.0.0.1:{fake_port}", STORAGE_PATH=tempfile.mkdtemp(prefix="bench-"),
+               EMBEDDED_WORKERS=str(args.workers), MISTRAL_MAX_RETRIES=os.environ.get("MISTRAL_MAX_RETRIES", "8"))
+    api = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(api_port), "--log-level", "warning"], env=env, cwd=ROOT)
+    try:
+        _wait_ready(f"http://127.0.0.1:{fake_port}/stats")
+        _wait_ready(f"http://127.0.0.1:{api_port}/api/queue")
+    except Exception:
+        for p in (api, fake):
+            p.terminate()
+        raise
+    args.url = f"http://127.0.0.1:{api_port}"
+    return [api, fake]
+
+async def run(args):
+    rows = []
+    for c in args.concurrency:
+        rows.append(await run_level(args, c))
+    print(f"jobs/level={args.jobs} pages/job={args.pages} size={args.size_kb} KB url={args.url}")
+    report(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end upload -> status -> result benchmark")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=lambda s: [int(x) for x in s.split(",")], default=[1, 4, 16], help="comma separated client counts")
+    parser.add_argument("--jobs", type=int, default=32, help="jobs per concurrency level")
+    parser.add_argument("--pages", type=int, default=3, help="pages per generated PDF")
+    parser.add_argument("--size-kb", type=int, default=64, help="size of each generated upload")
+    parser.add_argument("--poll", type=float, default=0.05, help="status polling interval (seconds)")
+    parser.add_argument("--timeout", type=float, default=300.0, help="give up on a job after this many seconds")
+    parser.add_argument("--spawn", action="store_true", help="start the fake Mistral server and the API for the run")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("MAX_WORKERS", "8")), help="embedded worker threads of the spawned API")
+    parser.add_argument("--fake-args", default="", help="extra arguments for scripts/fake_mistral.py")
+    args = parser.parse_args()
+    procs = spawn(args) if args.spawn else []
+    try:
+        asyncio.run(run(args))
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait(timeout=10)
+
+if __name__ == "__main__":
+    main()
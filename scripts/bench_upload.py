@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Upload throughput benchmark against a running API.
+
+    python scripts/bench_upload.py --url http://127.0.0.1:8000 --clients 8 --uploads 64 --size-mb 20
+
+N clients upload random files concurrently while a probe keeps calling /api/status, so the report
+shows both upload throughput and how responsive the API stays under upload load. Every upload is
+a distinct file (random bytes), so the result cache never short-circuits the run.
+Jobs created by the run are processed by the workers as usual (use EMBEDDED_WORKERS=0 and no
+standalone worker to benchmark the upload path alone).
+"""
+import os
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+def _pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+async def _uploader(client, url, queue, size, latencies, errors):
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        body = os.urandom(size)
+        t0 = time.perf_counter()
+        try:
+            r = await client.post(f"{url}/api/upload", files={"file": ("bench.pdf", body, "application/pdf")})
+            if r.status_code != 200:
+                errors.append(r.status_code)
+            else:
+                latencies.append(time.perf_counter() - t0)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+
+async def _probe(client, url, stop, latencies):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        try:
+            await client.get(f"{url}/api/status/bench-probe")
+            latencies.append(time.perf_counter() - t0)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.05)
+
+async def run(args):
+    size = int(args.size_mb * 1024 * 1024)
+    queue = asyncio.Queue()
+    for i in range(args.uploads):
+        queue.put_nowait(i)
+    upload_lat, status_lat, errors = [], [], []
+    stop = asyncio.Event()
+    limits = httpx.Limits(max_connections=args.clients + 2)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(600.0), limits=limits) as client:
+        probe = asyncio.create_task(_probe(client, args.url, stop, status_lat))
+        t0 = time.perf_counter()
+        await asyncio.gather(*(_uploader(client, args.url, queue, size, upload_lat, errors) for _ in range(args.clients)))
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        await probe
+
+    ok = len(upload_lat)
+    print(f"clients={args.clients} uploads={args.uploads} size={args.size_mb} MB")
+    print(f"elapsed           {elapsed:.2f} s")
+    print(f"uploads ok/failed {ok}/{len(errors)} {sorted(set(map(str, errors))) if errors else ''}")
+    print(f"throughput        {ok * size / elapsed / 1024 / 1024:.1f} MB/s, {ok / elapsed:.2f} uploads/s")
+    if upload_lat:
+        print(f"upload latency    p50 {_pct(upload_lat, 50) * 1000:.0f} ms  p99 {_pct(upload_lat, 99) * 1000:.0f} ms  mean {statistics.mean(upload_lat) * 1000:.0f} ms")
+    if status_lat:
+        print(f"status latency    p50 {_pct(status_lat, 50) * 1000:.1f} ms  p99 {_pct(status_lat, 99) * 1000:.1f} ms  max {max(status_lat) * 1000:.1f} ms  (n={len(status_lat)})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent upload throughput benchmark")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--uploads", type=int, default=32)
+    parser.add_argument("--size-mb", type=float, default=10)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the Mistral API endpoints used by the app (files, OCR, chat), for load tests
+and benchmarks without the live API, its costs or its rate limits.
+
+    python scripts/fake_mistral.py --port 8900 --latency-ms 50 --ocr-ms-per-page 100 --rate-429 0.02
+    MISTRAL_SERVER_URL=http://127.0.0.1:8900 uvicorn app.main:app
+
+Responses have the shape the SDK expects. OCR returns one markdown page per page of the uploaded
+PDF (counted from its page objects), or --pages for URLs and other files. A page holds a heading,
+a table and about --page-chars of text. Chat answers a fixed title, or a JSON object with title
+and summary when response_format asks for JSON. --rate-429 rejects that share of requests with 429
+and Retry-After. Every option can also be set as FAKE_<OPTION> in the environment. GET /stats
+returns the request counters.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import threading
+
+import uvicorn
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.responses import JSONResponse
+
+_PAGE_RE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+_WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+          "et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris").split()
+
+def _env(name, default):
+    return type(default)(os.environ.get(f"FAKE_{name.upper()}", default))
+
+class Config:
+    latency_ms = _env("latency_ms", 50.0)
+    jitter_ms = _env("jitter_ms", 20.0)
+    ocr_ms_per_page = _env("ocr_ms_per_page", 100.0)
+    chat_ms = _env("chat_ms", 300.0)
+    pages = _env("pages", 3)
+    page_chars = _env("page_chars", 2000)
+    rate_429 = _env("rate_429", 0.0)
+    retry_after = _env("retry_after", 1.0)
+
+cfg = Config()
+files = {}
+stats = {"files": 0, "signed_url": 0, "delete": 0, "ocr": 0, "chat": 0, "pages": 0, "throttled": 0}
+_lock = threading.Lock()
+
+app = FastAPI(title="fake-mistral")
+
+def _count(key, n=1):
+    with _lock:
+        stats[key] += n
+
+async def _delay(extra_ms=0.0):
+    ms = max(0.0, cfg.latency_ms + random.uniform(-cfg.jitter_ms, cfg.jitter_ms) + extra_ms)
+    await asyncio.sleep(ms / 1000.0)
+
+def _throttled():
+    if cfg.rate_429 > 0 and random.random() < cfg.rate_429:
+        _count("throttled")
+        return JSONResponse({"object": "error", "message": "Requests rate limit exceeded", "type": "rate_limited", "code": "1300"},
+                            status_code=429, headers={"Retry-After": str(cfg.retry_after)})
+    return None
+
+def _markdown(index):
+    rnd = random.Random(index)
+    words, size = [], 0
+    while size < cfg.page_chars:
+        w = rnd.choice(_WORDS)
+        words.append(w)
+        size += len(w) + 1
+    text = " ".join(words)
+    table = "| Item | Value |\n|:-----|------:|\n" + "\n".join(f"| {rnd.choice(_WORDS)} | {rnd.randint(1, 999)} |" for _ in range(3))
+    return f"# Page {index + 1}\n\n{text}\n\n{table}"
+
+@app.post("/v1/files")
+async def upload(file: UploadFile = File(...), purpose: str = Form("ocr")):
+    if (r := _throttled()):
+        return r
+    size, pages, tail = 0, 0, b""
+    while chunk := await file.read(1024 * 1024):
+        # count PDF page objects across chunk boundaries
+        data = tail + chunk
+        pages += len(_PAGE_RE.findall(data))
+        tail = data[-32:]
+        pages -= len(_PAGE_RE.findall(tail))
+        size += len(chunk)
+    pages += len(_PAGE_RE.findall(tail))
+    file_id = str(uuid.uuid4())
+    files[file_id] = {"size": size, "pages": pages or cfg.pages, "filename": file.filename}
+    _count("files")
+    await _delay(size / (50 * 1024 * 1024) * 1000)
+    return {"id": file_id, "object": "file", "bytes": size, "created_at": int(time.time()), "filename": file.filename or "upload",
+            "purpose": purpose, "sample_type": "pretrain", "source": "upload", "mimetype": file.content_type}
+
+@app.get("/v1/files/{file_id}/url")
+async def signed_url(file_id: str, request: Request, expiry: int = 24):
+    if (r := _throttled()):
+        return r
+    if file_id not in files:
+        return JSONResponse({"object": "error", "message": "file not found"}, status_code=404)
+    _count("signed_url")
+    await _delay()
+    return {"url": f"{str(request.base_url).rstrip('/')}/v1/files/{file_id}/content?expiry={expiry}"}
+
+@app.delete("/v1/files/{file_id}")
+async def delete(file_id: str):
+    if (r := _throttled()):
+        return r
+    if files.pop(file_id, None) is None:
+        return JSONResponse({"object": "error", "message": "file not found"}, status_code=404)
+    _count("delete")
+    await _delay()
+    return {"id": file_id, "object": "file", "deleted": True}
+
+def _document_pages(body):
+    url = ((body.get("document") or {}).get("document_url")) or ""
+    m = re.search(r"/v1/files/([^/]+)/content", url)
+    entry = files.get(m.group(1)) if m else None
+    return entry["pages"] if entry else cfg.pages
+
+@app.post("/v1/ocr")
+async def ocr(request: Request):
+    if (r := _throttled()):
+        return r
+    body = await request.json()
+    total = _document_pages(body)
+    indices = [i for i in (body.get("pages") or range(total)) if 0 <= i < total]
+    _count("ocr")
+    _count("pages", len(indices))
+    await _delay(cfg.ocr_ms_per_page * len(indices))
+    pages = [{"index": i, "markdown": _markdown(i), "images": [], "dimensions": {"dpi": 200, "height": 2200, "width": 1700}} for i in indices]
+    return {"pages": pages, "model": body.get("model") or "mistral-ocr-latest",
+            "usage_info": {"pages_processed": len(indices), "doc_size_bytes": None}}
+
+@app.post("/v1/chat/completions")
+async def chat(request: Request):
+    if (r := _throttled()):
+        return r
+    body = await request.json()
+    _count("chat")
+    await _delay(cfg.chat_ms)
+    content = "A Generated Document Title"
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        content = json.dumps({"title": content, "summary": _markdown(0)[:400]})
+    return {"id": uuid.uuid4().hex, "object": "chat.completion", "model": body.get("model") or "mistral-small-latest", "created": int(time.time()),
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}]}
+
+@app.get("/stats")
+async def get_stats():
+    with _lock:
+        return dict(stats, files_stored=len(files))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Mistral API (files / OCR / chat) for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("FAKE_PORT", "8900")))
+    parser.add_argument("--latency-ms", type=float, default=cfg.latency_ms, help="base latency of every request")
+    parser.add_argument("--jitter-ms", type=float, default=cfg.jitter_ms, help="uniform +/- jitter on the base latency")
+    parser.add_argument("--ocr-ms-per-page", type=float, default=cfg.ocr_ms_per_page, help="added OCR latency per page")
+    parser.add_argument("--chat-ms", type=float, default=cfg.chat_ms, help="added chat completion latency")
+    parser.add_argument("--pages", type=int, default=cfg.pages, help="pages of documents whose page count is unknown (URLs, non-PDF)")
+    parser.add_argument("--page-chars", type=int, default=cfg.page_chars, help="approximate markdown size per page")
+    parser.add_argument("--rate-429", type=float, default=cfg.rate_429, help="share of requests rejected with 429 (0..1)")
+    parser.add_argument("--retry-after", type=float, default=cfg.retry_after, help="Retry-After seconds sent with 429")
+    args = parser.parse_args(argv)
+    for key in ("latency_ms", "jitter_ms", "ocr_ms_per_page", "chat_ms", "pages", "page_chars", "rate_429", "retry_after"):
+        setattr(cfg, key, getattr(args, key))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import pytest
+
+from app.render import render_docx
+
+def runs(markdown):
+    paragraph = render_docx("", markdown).paragraphs[0]
+    return [(r.text, bool(r.bold), bool(r.italic), r.font.name == "Courier New") for r in paragraph.runs]
+
+@pytest.mark.parametrize("markdown, expected", [
+    ("*x* and *y*", [("x", False, True, False), (" and ", False, False, False), ("y", False, True, False)]),
+    ("_a_ and _b_", [("a", False, True, False), (" and ", False, False, False), ("b", False, True, False)]),
+    ("**b** and *i* and ***bi***", [("b", True, False, False), (" and ", False, False, False), ("i", False, True, False),
+                                    (" and ", False, False, False), ("bi", True, True, False)]),
+    ("snake_case_name and _it_", [("snake_case_name and ", False, False, False), ("it", False, True, False)]),
+])
+def test_emphasis_spans_on_one_line(markdown, expected):
+    assert runs(markdown) == expected
+
+@pytest.mark.parametrize("markdown, expected", [
+    ("2*3*4 and *literal* and `code*x*` end", [("2", False, False, False), ("3", False, True, False), ("4 and ", False, False, False),
+                                              ("literal", False, True, False), (" and ", False, False, False),
+                                              ("code*x*", False, False, True), (" end", False, False, False)]),
+    ("`a*b` and *c*", [("a*b", False, False, True), (" and ", False, False, False), ("c", False, True, False)]),
+    ("*see `x` here*", [("see ", False, True, False), ("x", False, True, True), (" here", False, True, False)]),
+    ("*a `b*` c*", [("a ", False, True, False), ("b*", False, True, True), (" c", False, True, False)]),
+])
+def test_emphasis_next_to_code(markdown, expected):
+    assert runs(markdown) == expected